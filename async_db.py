@@ -0,0 +1,85 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+# 🧵 Окремий пул потоків для SQLite: запити не блокують event loop,
+# і поки одна база працює, диспетчер обробляє інші чати
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+
+async def run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _wrap(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+
+def shutdown():
+    _executor.shutdown(wait=True)
+    database.shutdown()
+
+
+# 🔁 Асинхронні версії функцій з database.py
+init_db = _wrap(database.init_db)
+
+get_session = _wrap(database.get_session)
+flush_pending = _wrap(database.flush_pending)
+
+get_or_create_user = _wrap(database.get_or_create_user)
+set_nickname = _wrap(database.set_nickname)
+get_nickname = _wrap(database.get_nickname)
+get_last_card_time = _wrap(database.get_last_card_time)
+update_last_card_time = _wrap(database.update_last_card_time)
+
+DRAW_OK = database.DRAW_OK
+DRAW_NO_NICKNAME = database.DRAW_NO_NICKNAME
+DRAW_COOLDOWN = database.DRAW_COOLDOWN
+DRAW_EMPTY = database.DRAW_EMPTY
+DRAW_COMPLETE = database.DRAW_COMPLETE
+DRAW_NO_CARD = database.DRAW_NO_CARD
+
+draw_card = _wrap(database.draw_card)
+get_catalog = _wrap(database.get_catalog)
+get_all_cards = _wrap(database.get_all_cards)
+add_card_to_user = _wrap(database.add_card_to_user)
+get_last_user_card = _wrap(database.get_last_user_card)
+get_user_card_ids = _wrap(database.get_user_card_ids)
+get_user_collection_size = _wrap(database.get_user_collection_size)
+get_total_cards_count = _wrap(database.get_total_cards_count)
+get_collection_page = _wrap(database.get_collection_page)
+get_cards_count_by_rarity = _wrap(database.get_cards_count_by_rarity)
+get_rarity_stats = _wrap(database.get_rarity_stats)
+
+get_user_stats = _wrap(database.get_user_stats)
+get_user_profile = _wrap(database.get_user_profile)
+set_notify = _wrap(database.set_notify)
+get_notify_subscribers = _wrap(database.get_notify_subscribers)
+get_pending_notifications = _wrap(database.get_pending_notifications)
+mark_notified = _wrap(database.mark_notified)
+reconcile_user_stats = _wrap(database.reconcile_user_stats)
+
+get_leaderboard_rows = _wrap(database.get_leaderboard_rows)
+
+clear_all_cards = _wrap(database.clear_all_cards)
+delete_card_by_id = _wrap(database.delete_card_by_id)
+add_card = _wrap(database.add_card)
+update_card_image = _wrap(database.update_card_image)
+upsert_cards = _wrap(database.upsert_cards)
+invalidate_catalog = _wrap(database.invalidate_catalog)
+set_card_file_id = _wrap(database.set_card_file_id)
+clear_card_file_id = _wrap(database.clear_card_file_id)
+
+add_promo_code = _wrap(database.add_promo_code)
+create_one_time_code = _wrap(database.create_one_time_code)
+create_promo_codes = _wrap(database.create_promo_codes)
+use_promo_code = _wrap(database.use_promo_code)
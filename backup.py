@@ -0,0 +1,109 @@
+import os
+import time
+import glob
+import asyncio
+import logging
+import sqlite3
+import threading
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# 💾 Резервні копії бази: онлайн backup API SQLite невеликими порціями сторінок
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join("db", "backups"))
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL_HOURS", "6")) * 3600   # 0 — без розкладу
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", "256"))    # ~1 МБ за крок при сторінці 4 КБ
+STEP_SLEEP = 0.005                                           # пауза між кроками, с
+
+_running = threading.Lock()
+
+
+class BackupBusy(RuntimeError):
+    pass
+
+
+# Копія знімає знімок у власній транзакції читання: у WAL вона не блокує записи,
+# а копіювання не починається спочатку від кожного коміту інших з'єднань
+def run_backup(step_pages: int = STEP_PAGES, keep: int = BACKUP_KEEP) -> dict:
+    if not _running.acquire(blocking=False):
+        raise BackupBusy("Резервне копіювання вже триває")
+    try:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        name = time.strftime("cards-%Y%m%d-%H%M%S.db")
+        path = os.path.join(BACKUP_DIR, name)
+        tmp_path = f"{path}.tmp"
+        started = time.perf_counter()
+        steps = 0
+        total = 0
+
+        def progress(status, remaining, pages):
+            nonlocal steps, total
+            steps += 1
+            total = pages
+
+        database.flush_pending()
+        source = sqlite3.connect(database.DB_PATH, timeout=5, isolation_level=None)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            source.backup(target, pages=step_pages, progress=progress, sleep=STEP_SLEEP)
+            source.execute("COMMIT")
+            # Копія — один самодостатній файл, без -wal поруч
+            target.execute("PRAGMA journal_mode=DELETE")
+            if target.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise sqlite3.DatabaseError("Копія не пройшла quick_check")
+        except BaseException:
+            target.close()
+            os.remove(tmp_path)
+            raise
+        finally:
+            target.close()
+            source.close()
+        os.replace(tmp_path, path)
+
+        return {
+            "path": path,
+            "pages": total,
+            "steps": steps,
+            "bytes": os.path.getsize(path),
+            "duration": time.perf_counter() - started,
+            "removed": prune(keep),
+        }
+    finally:
+        _running.release()
+
+
+# 🧹 Залишаємо лише keep найновіших копій
+def prune(keep: int = BACKUP_KEEP) -> int:
+    backups = sorted(glob.glob(os.path.join(BACKUP_DIR, "cards-*.db")), reverse=True)
+    removed = 0
+    for path in backups[max(keep, 1):]:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            logger.warning("Cannot remove old backup %s: %s", path, e)
+    return removed
+
+
+# Копіювання йде в окремому потоці — цикл подій обслуговує гравців між кроками
+async def backup_now() -> dict:
+    return await asyncio.get_running_loop().run_in_executor(None, run_backup)
+
+
+async def backup_loop(interval: float = BACKUP_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            report = await backup_now()
+            logger.info(
+                "Backup %s: %s pages in %.1f s, removed %s old",
+                report["path"], report["pages"], report["duration"], report["removed"],
+            )
+        except BackupBusy:
+            pass
+        except Exception:
+            logger.exception("Scheduled backup failed")
@@ -0,0 +1,280 @@
+"""Мікробенчмарки шару даних.
+
+Запуск: python bench.py pool [--ops 20000]
+        python bench.py promo [--ops 10000]
+        python bench.py webhook [--ops 2000] [--updates recorded.jsonl]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+from collections import defaultdict, deque
+
+import database
+
+
+def _use_temp_db(folder: str):
+    database.close_pool()
+    database.DB_PATH = os.path.join(folder, "bench.db")
+    database.init_db()
+
+
+def _report(name: str, ops: int, elapsed: float):
+    print(f"{name:<28} {ops:>8} оп.  {elapsed:8.3f} с  {ops / elapsed:>10.0f} оп./с")
+
+
+# 🔌 Нове з'єднання на кожен виклик (як було до пулу) проти пулу
+def bench_pool(ops: int):
+    with tempfile.TemporaryDirectory() as folder:
+        _use_temp_db(folder)
+        users = 1000
+        for uid in range(users):
+            database.get_or_create_user(uid, f"user{uid}")
+            database.set_nickname(uid, f"nick{uid}")
+
+        def fresh_read(uid):
+            conn = sqlite3.connect(database.DB_PATH, timeout=5)
+            row = conn.execute("SELECT nickname FROM users WHERE user_id=?", (uid,)).fetchone()
+            conn.close()
+            return row
+
+        def fresh_write(uid):
+            conn = sqlite3.connect(database.DB_PATH, timeout=5)
+            conn.execute("UPDATE users SET last_card_time=? WHERE user_id=?", (int(time.time()), uid))
+            conn.commit()
+            conn.close()
+
+        # Той самий SQL через пул: get_nickname / update_last_card_time тепер ідуть
+        # через кеш сесій і відкладений запис і міряли б уже не пул
+        def pooled_read(uid):
+            with database.connection() as conn:
+                return conn.execute("SELECT nickname FROM users WHERE user_id=?", (uid,)).fetchone()
+
+        def pooled_write(uid):
+            with database.connection() as conn:
+                conn.execute("UPDATE users SET last_card_time=? WHERE user_id=?", (int(time.time()), uid))
+
+        ids = [random.randrange(users) for _ in range(ops)]
+
+        start = time.perf_counter()
+        for uid in ids:
+            fresh_read(uid)
+        _report("read / connect per call", ops, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for uid in ids:
+            pooled_read(uid)
+        _report("read / pool", ops, time.perf_counter() - start)
+
+        writes = ids[: ops // 10]
+        start = time.perf_counter()
+        for uid in writes:
+            fresh_write(uid)
+        _report("write / connect per call", len(writes), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for uid in writes:
+            pooled_write(uid)
+        _report("write / pool", len(writes), time.perf_counter() - start)
+
+        database.close_pool()
+
+
+# 🎟️ Пакетна генерація промокодів (ціль — 10k менш ніж за секунду)
+def bench_promo(ops: int):
+    with tempfile.TemporaryDirectory() as folder:
+        _use_temp_db(folder)
+
+        start = time.perf_counter()
+        codes = database.create_promo_codes(ops, uses=1)
+        _report("create_promo_codes batch", len(codes), time.perf_counter() - start)
+
+        single = max(1, ops // 10)
+        start = time.perf_counter()
+        for _ in range(single):
+            database.create_one_time_code(1)
+        _report("create_one_time_code loop", single, time.perf_counter() - start)
+
+        database.close_pool()
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def _synthetic_updates(ops: int) -> list:
+    # Кожен гравець проходить звичний сценарій; гравців достатньо, щоб антифлуд не різав навантаження
+    script = ["/start", "/setname Гравець{uid}", "/card", "/profile", "/top", "/collection"]
+    users = max(1, -(-ops // len(script)))
+    now = int(time.time())
+    updates = []
+    for i in range(ops):
+        uid = 100000 + i % users
+        text = script[i // users % len(script)].format(uid=uid)
+        updates.append({
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": now,
+                "chat": {"id": uid, "type": "private"},
+                "from": {"id": uid, "is_bot": False, "first_name": "Bench", "username": f"user{uid}"},
+                "text": text,
+            },
+        })
+    return updates
+
+
+def _load_updates(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _update_chat_id(update: dict):
+    for key in ("message", "edited_message", "callback_query"):
+        event = update.get(key)
+        if event:
+            return event["from"]["id"]
+    return None
+
+
+# 📡 Фейковий Telegram: приймає вихідні запити бота, миттєво відповідає
+# і фіксує момент першої відповіді на кожне надіслане оновлення
+class FakeTelegram:
+    def __init__(self):
+        self.pending = defaultdict(deque)
+        self.latencies = []
+        self.calls = 0
+        self.last_call = time.perf_counter()
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        method = request.match_info["method"]
+        form = await request.post()
+        self.calls += 1
+        self.last_call = time.perf_counter()
+
+        chat_id = form.get("chat_id")
+        if chat_id is not None and method.startswith(("send", "edit")):
+            chat_id = int(chat_id)
+            queue = self.pending.get(chat_id)
+            if queue:
+                self.latencies.append(self.last_call - queue.popleft())
+            result = {
+                "message_id": self.calls,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": form.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+async def _bench_webhook(ops: int, updates_path: str = None):
+    from aiohttp import ClientSession, web
+
+    os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+    import bot as app_bot
+    import outbound
+    from aiogram.client.telegram import TelegramAPIServer
+
+    updates = _load_updates(updates_path) if updates_path else _synthetic_updates(ops)
+
+    fake = FakeTelegram()
+    fake_app = web.Application()
+    fake_app.router.add_post("/bot{token}/{method}", fake.handle)
+    fake_runner = web.AppRunner(fake_app)
+    await fake_runner.setup()
+    fake_site = web.TCPSite(fake_runner, "127.0.0.1", 0)
+    await fake_site.start()
+    fake_port = fake_runner.addresses[0][1]
+    app_bot.bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{fake_port}")
+
+    await app_bot.prepare()
+    app_bot.throttler.exempt_ids.clear()
+    # Міряємо сам бот, а не ліміти Telegram — вихідна черга не стримує відповіді
+    app_bot.sender.gate = outbound.PriorityGate(1e9, 1e9)
+    app_bot.sender.chat_limit = (1e9, 1e9)
+    runner = web.AppRunner(app_bot.build_webhook_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    url = f"http://127.0.0.1:{runner.addresses[0][1]}{app_bot.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": app_bot.WEBHOOK_SECRET}
+
+    acks = []
+    limit = asyncio.Semaphore(40)   # Telegram за замовчуванням тримає до 40 з'єднань
+
+    async def post(http, update):
+        async with limit:
+            chat_id = _update_chat_id(update)
+            sent = time.perf_counter()
+            if chat_id is not None:
+                fake.pending[chat_id].append(sent)
+            async with http.post(url, json=update, headers=headers) as resp:
+                await resp.read()
+                assert resp.status == 200, resp.status
+            acks.append(time.perf_counter() - sent)
+
+    try:
+        async with ClientSession() as http:
+            async with http.post(url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as resp:
+                assert resp.status == 401, "вебхук прийняв запит з неправильним секретом"
+
+            start = time.perf_counter()
+            await asyncio.gather(*(post(http, u) for u in updates))
+            posted = time.perf_counter() - start
+
+            # Чекаємо, поки фонова обробка затихне
+            while time.perf_counter() - fake.last_call < 1.0:
+                await asyncio.sleep(0.1)
+            elapsed = fake.last_call - start
+    finally:
+        await runner.cleanup()
+        await fake_runner.cleanup()
+
+    _report("webhook POST (ack)", len(updates), posted)
+    _report("webhook end-to-end", len(fake.latencies), elapsed)
+    print(f"{'ack latency':<28} p50 {_percentile(acks, 0.5) * 1000:7.2f} мс  p99 {_percentile(acks, 0.99) * 1000:7.2f} мс")
+    print(f"{'reply latency':<28} p50 {_percentile(fake.latencies, 0.5) * 1000:7.2f} мс  "
+          f"p99 {_percentile(fake.latencies, 0.99) * 1000:7.2f} мс")
+    print(f"{'no reply':<28} {len(updates) - len(fake.latencies):>8}   запитів до Telegram: {fake.calls}")
+
+
+# 🌐 Вебхук-режим бота проти фейкового Telegram: затримка підтвердження,
+# затримка відповіді та пропускна здатність на записаних або синтетичних оновленнях
+def bench_webhook(ops: int, updates_path: str = None):
+    with tempfile.TemporaryDirectory() as folder:
+        _use_temp_db(folder)
+        asyncio.run(_bench_webhook(ops, updates_path))
+        database.close_pool()
+
+
+BENCHMARKS = {
+    "pool": bench_pool,
+    "promo": bench_promo,
+    "webhook": bench_webhook,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--updates", help="JSONL із записаними оновленнями Telegram (для webhook)")
+    args = parser.parse_args(argv)
+    if args.name == "webhook":
+        return bench_webhook(args.ops, args.updates)
+    BENCHMARKS[args.name](args.ops)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
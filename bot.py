@@ -2,55 +2,105 @@ print("Bot is starting...")
 
 import os
 import time
-import random
+import signal
 import asyncio
 import logging
+import secrets
+import tempfile
 
+from aiohttp import web
 from dotenv import load_dotenv
 from aiogram.enums import ParseMode
-from database import get_nickname, get_user_collection_size, get_connection
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 from aiogram.filters import Command
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
-
-from database import (
-    init_db,
-    get_or_create_user,
-    get_nickname,
-    set_nickname,
-    get_last_card_time,
-    update_last_card_time,
-    get_all_cards,
-    add_card_to_user,
-    get_last_user_card,
-    get_user_collection_size,
-    get_total_cards_count,
-    get_rarity_stats,
-    add_promo_code,
-    use_promo_code,
-    add_card,
-    delete_card_by_id
-)
+import async_db as db
+import rarity
+import images
+import backup
+import leaderboard
+import metrics
+import bot_metrics
+import catalog_import
+import notifications
+import outbound
+import sharding
+from cache import LRUCache
+from throttling import ThrottlingMiddleware
+from scheduling import UserScheduler
+from outbound import OutboundSender
 
 # 🔧 Налаштування
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
 ADMIN_ID = int(os.getenv("ADMIN_ID", "5189937995")) 
 COOLDOWN = 3600
+MAX_PROMO_BATCH = 100000
+COLLECTION_PAGE_SIZE = 20
 BOT_USERNAME = "gd_cards_ua_bot"
 
-bot = Bot(token=TOKEN)
+# 🌐 Доставка оновлень: BOT_MODE=polling (за замовчуванням) або webhook.
+# У Procfile: worker — polling, web — webhook; масштабувати слід лише один із них.
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")          # публічна адреса застосунку, напр. https://gdcards.herokuapp.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", "8080"))
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")    # локальний Bot API сервер або фейковий Telegram для тестів
+
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=TOKEN, session=session)
+
+# 📤 Усі запити до Bot API йдуть через спільну чергу з лімітами і повторами
+sender = OutboundSender()
+bot.session.middleware(sender)
 dp = Dispatcher()
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 🚦 Антифлуд: відсікаємо спам до хендлерів і запитів до бази
+throttler = ThrottlingMiddleware(exempt_ids=(ADMIN_ID,))
+dp.update.outer_middleware(throttler)
+
+# 🧵 Паралельно між гравцями, по черзі в межах одного гравця
+scheduler = UserScheduler()
+dp.update.outer_middleware(scheduler)
+
+# 📈 Час хендлерів (без очікування в черзі гравця) і лічильники інших шарів
+dp.update.outer_middleware(bot_metrics.HandlerTimingMiddleware(
+    bot_metrics.HANDLER_NAMES | {"start", "setname", "admin", "notify"}
+))
+metrics.gauge("bot_scheduler_running", "Оновлення в обробці", lambda: scheduler.running)
+metrics.gauge("bot_scheduler_waiting", "Оновлення в черзі", lambda: scheduler.waiting)
+metrics.gauge("bot_throttled_total", "Оновлення, відсічені антифлудом", lambda: throttler.dropped, "counter")
+metrics.gauge("bot_outbound_sent_total", "Надіслані запити до Bot API", lambda: sender.sent, "counter")
+metrics.gauge("bot_outbound_delayed_total", "Запити, що чекали на ліміт", lambda: sender.delayed, "counter")
+metrics.gauge("bot_outbound_retried_total", "Повтори запитів до Bot API", lambda: sender.retried, "counter")
+metrics.gauge("bot_outbound_dropped_total", "Втрачені вихідні повідомлення", lambda: sender.dropped, "counter")
+metrics.gauge("bot_leaderboard_players", "Гравців у рейтингу", lambda: len(leaderboard.board))
+
+# 🔔 Сповіщення про готовність наступної картки (/notify on)
+notifier = notifications.ReadyNotifier(COOLDOWN)
+metrics.gauge("bot_notify_scheduled", "Заплановані сповіщення про картку", lambda: len(notifier))
+metrics.gauge("bot_notify_sent_total", "Надіслані сповіщення про картку", lambda: notifier.sent, "counter")
+
+# 📋 Відрендерені сторінки колекції: user_id -> {(версія каталогу, напрям, курсор): (текст, кнопки)}
+collection_pages = LRUCache(maxsize=5000)
+MAX_CACHED_PAGES_PER_USER = 20
 
 # 📬 Безпечна відповідь
 async def safe_reply(message: types.Message, text: str, **kwargs):
     try:
         await message.answer(text, **kwargs)
     except Exception as e:
-        print(f"⚠️ Виняток: {e}")
+        logger.warning("⚠️ Не вдалося відповісти в чат %s: %s", message.chat.id, e)
 
 # 🚀 /start
 @dp.message(Command("start"))
@@ -58,8 +108,8 @@ async def cmd_start(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username
 
-    get_or_create_user(user_id, username)
-    nickname = get_nickname(user_id)
+    await db.get_or_create_user(user_id, username)
+    nickname = await db.get_nickname(user_id)
 
     if nickname:
         await safe_reply(message, f"👋 Привіт, {nickname}!\nОтримай свою картку: /card")
@@ -75,7 +125,9 @@ async def cmd_setname(message: types.Message):
         return
 
     nickname = parts[1].strip()
-    set_nickname(message.from_user.id, nickname)
+    await db.set_nickname(message.from_user.id, nickname)
+    leaderboard.board.rename(message.from_user.id, nickname)
+    collection_pages.pop(message.from_user.id)
     await safe_reply(message, f"✅ Нік встановлено: {nickname}")
 
 # 🎁 /promo
@@ -88,7 +140,7 @@ async def cmd_promo(message: types.Message):
 
     code = parts[1].strip().upper()
     user_id = message.from_user.id
-    response = use_promo_code(user_id, code)
+    response = await db.use_promo_code(user_id, code)
     await safe_reply(message, response)
 
 # 🛠️ /admin
@@ -105,14 +157,20 @@ async def cmd_admin(message: types.Message):
             "⚙️ Адмін-команди:\n"
             "/admin view — показати всі картки\n"
             "/admin clear ID — видалити картку за ID\n"
-            "/admin add Назва Рідкість Опис ШляхДоФото"
+            "/admin add Назва Рідкість Опис ШляхДоФото\n"
+            "Надішли маніфест .csv / .json / .jsonl документом — пакетний імпорт карток\n"
+            "/admin reload — перечитати каталог і рейтинг\n"
+            "/admin backup — резервна копія бази\n"
+            "/admin image ID НазваФото.png — замінити фото картки\n"
+            "/admin reconcile — перерахувати очки і лічильники гравців\n"
+            "/admin stats — навантаження бота"
         )
         return
 
     cmd = parts[1].lower()
 
     if cmd == "view":
-        cards = get_all_cards()
+        cards = await db.get_all_cards()
         if not cards:
             await safe_reply(message, "📦 У базі немає карток.")
             return
@@ -127,12 +185,88 @@ async def cmd_admin(message: types.Message):
             await safe_reply(message, "❌ Формат: /admin clear ID\n(наприклад: /admin clear 5)")
             return
         card_id = int(parts[2])
-        success = delete_card_by_id(card_id)
+        success = await db.delete_card_by_id(card_id)
         if success:
+            leaderboard.board.load(await db.get_leaderboard_rows())
             await safe_reply(message, f"🗑️ Картку з ID {card_id} успішно видалено.")
         else:
             await safe_reply(message, f"❌ Картку з ID {card_id} не знайдено.")
 
+    elif cmd == "image":
+        args = parts[2].split() if len(parts) == 3 else []
+        if len(args) != 2 or not args[0].isdigit():
+            await safe_reply(message, "❌ Формат: /admin image ID НазваФото.png")
+            return
+
+        card_id = int(args[0])
+        try:
+            image_path = await db.run(images.ingest_image, images.resolve_source(args[1]))
+        except images.ImageError as e:
+            await safe_reply(message, f"❌ {e}")
+            return
+
+        if await db.update_card_image(card_id, image_path):
+            await safe_reply(message, f"🖼️ Фото картки {card_id} оновлено.")
+        else:
+            await safe_reply(message, f"❌ Картку з ID {card_id} не знайдено.")
+
+    elif cmd == "stats":
+        stats = scheduler.stats()
+        sent = sender.stats()
+        notify = notifier.stats()
+        await safe_reply(message,
+            "📊 Навантаження:\n"
+            f"Обробляється зараз: {stats['running']} / {scheduler.max_concurrency}\n"
+            f"У черзі: {stats['waiting']} (максимум {stats['max_waiting']})\n"
+            f"Активних гравців: {stats['active_users']}\n"
+            f"Оброблено: {stats['handled']}\n"
+            f"Очікування: сер. {stats['wait_avg_ms']:.1f} мс, макс. {stats['wait_max_ms']:.1f} мс\n"
+            f"Відсічено антифлудом: {throttler.dropped}\n\n"
+            f"📤 Вихідні: надіслано {sent['sent']}, затримано {sent['delayed']}, "
+            f"повторено {sent['retried']}, втрачено {sent['dropped']}, у черзі {sent['queued']}\n"
+            f"🔔 Сповіщення: підписано {notify['subscribers']}, заплановано {notify['scheduled']}, "
+            f"надіслано {notify['sent']}, помилок {notify['failed']}\n\n"
+            "⏱️ Хендлери (к-сть, сер. / p50 / p99 мс):\n"
+            + "".join(
+                f"{row['name']}: {row['count']}, {row['avg_ms']:.1f} / {row['p50_ms']:.1f} / {row['p99_ms']:.1f}\n"
+                for row in metrics.summary(metrics.HANDLER_SECONDS)
+            )
+            + "\n🗄️ База (к-сть, сер. / p99 мс):\n"
+            + "".join(
+                f"{row['name']}: {row['count']}, {row['avg_ms']:.2f} / {row['p99_ms']:.2f}\n"
+                for row in metrics.summary(metrics.DB_SECONDS)
+            )
+        )
+
+    elif cmd == "reload":
+        await db.invalidate_catalog()
+        leaderboard.board.load(await db.get_leaderboard_rows())
+        catalog = await db.get_catalog()
+        await safe_reply(message, f"🔄 Каталог перечитано: {catalog.total} карток.")
+
+    elif cmd == "backup":
+        await safe_reply(message, "💾 Створюю резервну копію…")
+        try:
+            report = await backup.backup_now()
+        except backup.BackupBusy as e:
+            await safe_reply(message, f"⏳ {e}")
+            return
+        except Exception as e:
+            logger.exception("Backup failed")
+            await safe_reply(message, f"❌ Не вдалося створити копію: {e}")
+            return
+        await safe_reply(message,
+            f"✅ Копія: {report['path']}\n"
+            f"Сторінок: {report['pages']} ({report['bytes'] / 1024 / 1024:.1f} МБ) за {report['steps']} кроків\n"
+            f"Тривалість: {report['duration']:.2f} с\n"
+            f"Видалено старих копій: {report['removed']}"
+        )
+
+    elif cmd == "reconcile":
+        users = await db.reconcile_user_stats()
+        leaderboard.board.load(await db.get_leaderboard_rows())
+        await safe_reply(message, f"🔄 Лічильники перераховано для {users} гравців.")
+
     elif cmd == "add":
         if len(parts) < 3:
             await safe_reply(message, "❌ Формат: /admin add Назва Рідкість Опис НазваФото.png")
@@ -150,78 +284,88 @@ async def cmd_admin(message: types.Message):
                 await safe_reply(message, "❌ Помилка: недостатньо аргументів для опису")
                 return
 
-            name, rarity, description = split_text
-            base_path = "C:/Users/ogorn/Desktop/gdcard_bot/data/images/cards/"
-            image_path = os.path.join(base_path, filename)
-
-            if not os.path.exists(image_path):
-                await safe_reply(message, f"❌ Файл не знайдено: `{image_path}`")
+            name, card_rarity, description = split_text
+            try:
+                image_path = await db.run(images.ingest_image, images.resolve_source(filename))
+            except images.ImageError as e:
+                await safe_reply(message, f"❌ {e}")
                 return
 
-            add_card(name, rarity, description, image_path)
-            await safe_reply(message, f"✅ Додано картку: «{name}» ({rarity})")
+            await db.add_card(name, card_rarity, description, image_path)
+            await safe_reply(message, f"✅ Додано картку: «{name}» ({card_rarity})")
 
         except Exception as e:
             await safe_reply(message, f"❌ Помилка при додаванні: {e}")
 
+# 📦 Пакетний імпорт: адмін надсилає маніфест документом, зображення беруться з CARDS_INCOMING_DIR
+@dp.message(lambda m: m.document is not None and m.from_user is not None and m.from_user.id == ADMIN_ID)
+async def admin_import(message: types.Message):
+    filename = os.path.basename(message.document.file_name or "")
+    if not filename.lower().endswith((".csv", ".json", ".jsonl")):
+        await safe_reply(message, "❌ Маніфест має бути у форматі .csv, .json або .jsonl")
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, filename)
+        await message.bot.download(message.document, destination=path)
+        try:
+            result = await db.run(catalog_import.import_manifest, path)
+        except (catalog_import.ManifestError, ValueError, OSError) as e:
+            await safe_reply(message, f"❌ {e}")
+            return
+        except Exception as e:
+            # Уже закомічені пачки лишаються в базі — рейтинг перечитуємо і тут
+            logger.exception("Catalog import failed")
+            leaderboard.board.load(await db.get_leaderboard_rows())
+            await safe_reply(message, f"❌ Імпорт перервано: {e}\nЧастину карток могло бути вже додано.")
+            return
+
+    if result["rarity_changed"]:
+        leaderboard.board.load(await db.get_leaderboard_rows())
+    await safe_reply(message, catalog_import.format_result(result))
+
 
 
 # 🃏 /card
 @dp.message(Command(commands=["card", f"card@{BOT_USERNAME}"]))
 async def cmd_card(message: types.Message):
     user_id = message.from_user.id
-    nickname = get_nickname(user_id)
 
-    if not nickname:
+    # 🎲 Перевірка кулдауну, вибір, запис і час — одна транзакція
+    now = int(time.time())
+    result = await db.draw_card(user_id, COOLDOWN, now)
+    status = result["status"]
+
+    if status == db.DRAW_NO_NICKNAME:
         await safe_reply(message, "❌ Спочатку зареєструйся: /start → /setname Ім'я")
         return
 
-    now = int(time.time())
-    last_time = get_last_card_time(user_id)
-    if now - last_time < COOLDOWN:
-        mins, secs = divmod(COOLDOWN - (now - last_time), 60)
+    if status == db.DRAW_COOLDOWN:
+        mins, secs = divmod(result["remaining"], 60)
         await safe_reply(message, f"⏳ Наступна картка через {mins} хв. {secs} сек.")
         return
 
-    cards = get_all_cards()
-    if not cards:
+    if status == db.DRAW_EMPTY:
         await safe_reply(message, "❌ У базі немає карток.")
         return
 
-    collection_user = get_user_collection_size(user_id)
-    collection_total = get_total_cards_count()
-    if collection_user >= collection_total:
+    if status == db.DRAW_COMPLETE:
         await safe_reply(message, "🏆 Ви вже зібрали всю колекцію!\nОчікуйте оновлення або використайте /promo ✨")
         return
 
-    last_card_id = get_last_user_card(user_id)
-    available_cards = [card for card in cards if card["id"] != last_card_id]
-
-    if not available_cards:
+    if status == db.DRAW_NO_CARD:
         await safe_reply(message, "📦 Немає нової картки. Спробуйте трохи пізніше.")
         return
 
-    weights = {
-        "common": 60, "rare": 25, "super_rare": 10,
-        "epic": 5, "mythic": 3, "legendary": 1, "divine": 0.2
-    }
-    pool = [(card, weights.get(card["rarity"], 1)) for card in available_cards]
-    choices, card_weights = zip(*pool)
-    card = random.choices(choices, weights=card_weights, k=1)[0]
-
-    add_card_to_user(user_id, card["id"])
-    update_last_card_time(user_id)
-
-    rarity_count, rarity_total, rarity_percent = get_rarity_stats(card["rarity"])
-    rarity_label = {
-        "common": "Звичайна ⚪️",
-        "rare": "Рідкісна 🟢",
-        "super_rare": "Суперрідкісна 🔵",
-        "epic": "Епічна 🟣",
-        "mythic": "Міфічна 🔴",
-        "legendary": "Легендарна 🟡",
-        "divine": "Божественна ✴️"
-    }
+    card = result["card"]
+    nickname = result["nickname"]
+    collection_user = result["card_count"]
+    collection_total = result["collection_total"]
+    rarity_count, rarity_total, rarity_percent = result["rarity_stats"]
+
+    leaderboard.board.update(user_id, nickname, result["username"], result["card_count"], result["points"])
+    collection_pages.pop(user_id)
+    notifier.schedule(user_id, now)
 
     caption = (
         f"🃏 НОВА КАРТКА 🃏\n"
@@ -231,24 +375,45 @@ async def cmd_card(message: types.Message):
         f"Картка: \"{card['name']}\"\n"
         f"Опис: {card['description']}\n"
         f"━━━━━━━━━━━━━━━━\n"
-        f"Рідкість: {rarity_label.get(card['rarity'], card['rarity'].capitalize())} "
+        f"Рідкість: {rarity.label(card['rarity'])} "
         f"({rarity_count}/{rarity_total}) ({rarity_percent:.2f}%)\n"
-        f"Очки: +1\n"
+        f"Очки: +{rarity.points(card['rarity'])}\n"
         f"Колекція: {collection_user}/{collection_total} карток\n"
         f"━━━━━━━━━━━━━━━━"
     )
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📁 Моя колекція", callback_data="collection")]
+        [InlineKeyboardButton(text="📁 Моя колекція", callback_data=f"collection:{user_id}")]
     ])
 
-    photo = FSInputFile(card["image_path"])
-    await message.answer_photo(
-        photo=photo,
+    await send_card_photo(message, card, caption, keyboard)
+
+
+# 🖼️ Фото картки: спершу збережений file_id, інакше — байти з кешу зображень
+async def send_card_photo(message: types.Message, card: dict, caption: str, keyboard: InlineKeyboardMarkup):
+    file_id = card.get("file_id")
+    if file_id:
+        try:
+            return await message.answer_photo(
+                photo=file_id,
+                caption=caption,
+                parse_mode="Markdown",
+                reply_markup=keyboard
+            )
+        except TelegramBadRequest:
+            # Telegram не прийняв старий file_id — завантажуємо заново
+            await db.clear_card_file_id(card["id"])
+
+    data = await db.run(images.load_image, card["image_path"])
+    sent = await message.answer_photo(
+        photo=BufferedInputFile(data, filename=os.path.basename(card["image_path"])),
         caption=caption,
         parse_mode="Markdown",
         reply_markup=keyboard
     )
+    if sent.photo:
+        await db.set_card_file_id(card["id"], sent.photo[-1].file_id)
+    return sent
 
 
 # /genpromo
@@ -259,33 +424,70 @@ async def cmd_genpromo(message: types.Message):
         return
 
     parts = message.text.strip().split()
-    if len(parts) != 2 or not parts[1].isdigit():
-        await safe_reply(message, "❌ Формат:\n/genpromo КІЛЬКІСТЬ_ВИКОРИСТАНЬ\nНапр: /genpromo 3")
+    if len(parts) not in (2, 3) or not all(p.isdigit() for p in parts[1:]):
+        await safe_reply(message,
+            "❌ Формат:\n/genpromo КІЛЬКІСТЬ_ВИКОРИСТАНЬ [КІЛЬКІСТЬ_КОДІВ]\n"
+            "Напр: /genpromo 3 або /genpromo 1 5000"
+        )
         return
 
     count = int(parts[1])
-    from database import create_one_time_code
-    promo = create_one_time_code(count)
-    await safe_reply(message, f"🔐 Промокод згенеровано:\n`{promo}`\nАктивацій: {count}", parse_mode="Markdown")
+    codes_count = int(parts[2]) if len(parts) == 3 else 1
+    if not 1 <= codes_count <= MAX_PROMO_BATCH:
+        await safe_reply(message, f"❌ Кількість кодів: від 1 до {MAX_PROMO_BATCH}")
+        return
+
+    if codes_count == 1:
+        promo = await db.create_one_time_code(count)
+        await safe_reply(message, f"🔐 Промокод згенеровано:\n`{promo}`\nАктивацій: {count}", parse_mode="Markdown")
+        return
+
+    # 📄 Великий пакет — файлом, а не повідомленням
+    codes = await db.create_promo_codes(codes_count, count)
+    content = "code,uses\n" + "".join(f"{code},{count}\n" for code in codes)
+    document = BufferedInputFile(content.encode("utf-8"), filename=f"promo_{codes_count}x{count}.csv")
+    await message.answer_document(document, caption=f"🔐 Згенеровано {codes_count} промокодів\nАктивацій: {count}")
+
+
+# 🔔 /notify on|off
+@dp.message(Command("notify"))
+async def cmd_notify(message: types.Message):
+    user_id = message.from_user.id
+    args = message.text.split(maxsplit=1)
+    choice = args[1].strip().lower() if len(args) > 1 else ""
+
+    if choice not in ("on", "off"):
+        state = "увімкнені" if notifier.is_subscribed(user_id) else "вимкнені"
+        await safe_reply(message, f"🔔 Сповіщення про нову картку {state}.\nВикористання: /notify on або /notify off")
+        return
+
+    await db.get_or_create_user(user_id, message.from_user.username or "без ніка")
+    last_card_time = await db.set_notify(user_id, choice == "on")
+    if choice == "on":
+        notifier.subscribe(user_id, last_card_time or 0)
+        await safe_reply(message, "🔔 Напишу, щойно можна буде отримати нову картку.")
+    else:
+        notifier.unsubscribe(user_id)
+        await safe_reply(message, "🔕 Сповіщення вимкнено.")
 
 
 # /profile
 @dp.message(Command("profile"))
 async def cmd_profile(message: types.Message):
-    from database import get_nickname, get_user_collection_size, get_total_cards_count, get_last_card_time
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
     user_id = message.from_user.id
     username = message.from_user.username or "без ніка"
 
-    get_or_create_user(user_id, username)
-    nickname = get_nickname(user_id) or username
-    collected = get_user_collection_size(user_id)
-    total_cards = get_total_cards_count()
-    last_time = get_last_card_time(user_id)
-    collection_points = collected
-    rating = "—"
-    notifications = "выкл"
+    await db.get_or_create_user(user_id, username)
+    profile = await db.get_user_profile(user_id)
+    nickname = profile["nickname"] or username
+    collected = profile["card_count"]
+    total_cards = await db.get_total_cards_count()
+    collection_points = profile["points"]
+    rank = leaderboard.board.rank(user_id)
+    rating = f"#{rank}" if rank else "—"
+    notifications = "увімк" if profile["notify"] else "вимк (/notify on)"
 
     text = (
         f"👤 **Профіль гравця**\n"
@@ -293,7 +495,7 @@ async def cmd_profile(message: types.Message):
         f"Рейтинг: {rating}\n"
         f"Карток зібрано: **{collected} / {total_cards}**\n"
         f"Очки колекції: **{collection_points}**\n"
-        f"Уведомлення: {notifications}"
+        f"Сповіщення: {notifications}"
     )
 
     keyboard = InlineKeyboardMarkup(
@@ -308,136 +510,107 @@ async def cmd_profile(message: types.Message):
 
 
 # 📋 Показ колекції (спільна логіка для /collection і кнопки)
-async def show_collection(user_id: int, message: types.Message):
-    nickname = get_nickname(user_id)
+async def show_collection(user_id: int, message: types.Message, cursor: tuple = None, backward: bool = False):
+    nickname = await db.get_nickname(user_id)
     if not nickname:
         await safe_reply(message, "❌ Спочатку зареєструйся: /start → /setname Ім'я")
         return
 
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT cards.name, cards.rarity
-        FROM user_cards
-        JOIN cards ON user_cards.card_id = cards.id
-        WHERE user_cards.user_id = ?
-    """, (user_id,))
-    user_cards = c.fetchall()
-
-    c.execute("SELECT rarity, COUNT(*) FROM cards GROUP BY rarity")
-    total_by_rarity = dict(c.fetchall())
-    conn.close()
-
-    rarity_order = [
-        ("divine", "Божественна ✴️", 15),
-        ("legendary", "Легендарна 🟡", 10),
-        ("mythic", "Міфічна 🔴", 7),
-        ("epic", "Епічна 🟣", 5),
-        ("super_rare", "Суперрідкісна 🔵", 3),
-        ("rare", "Рідкісна 🟢", 2),
-        ("common", "Звичайна ⚪️", 1)
-    ]
+    catalog = await db.get_catalog()
+    page_key = (catalog.version, backward, cursor)
+    pages = collection_pages.get(user_id)
+    cached = pages.get(page_key) if pages is not None else None
 
-    cards_by_rarity = {}
-    for name, rarity in user_cards:
-        cards_by_rarity.setdefault(rarity, []).append(name)
+    if cached is None:
+        page = await db.get_collection_page(user_id, cursor, backward, COLLECTION_PAGE_SIZE)
+        stats = await db.get_user_stats(user_id)
+        cached = render_collection_page(user_id, nickname, catalog, stats, page)
 
-    total_cards = sum(total_by_rarity.values())
-    collected_cards = len(user_cards)
-    total_points = 0
+        if pages is None or len(pages) >= MAX_CACHED_PAGES_PER_USER:
+            pages = {}
+            collection_pages.set(user_id, pages)
+        pages[page_key] = cached
 
-    reply = f"📋 Колекція гравця **{nickname}**\n━━━━━━━━━━━━━━━━\n"
+    reply, keyboard = cached
 
+    try:
+        await message.edit_text(reply, parse_mode="Markdown", reply_markup=keyboard)
+    except Exception:
+        await safe_reply(message, reply, parse_mode="Markdown", reply_markup=keyboard)
 
-    for key, label, points_per_card in rarity_order:
-        owned = cards_by_rarity.get(key, [])
-        total = total_by_rarity.get(key, 0)
-        points = len(owned) * points_per_card
-        total_points += points
 
-        reply += f"**{label}**: {len(owned)}/{total} карток, {points} оч.\n"
-        for name in owned:
-            reply += f"• {name}\n"
-        reply += "\n"
 
-    reply += f"━━━━━━━━━━━━━━━━\n"
-    reply += f"🔢 Всього: {collected_cards}/{total_cards} карток\n"
-    reply += f"🏅 Очки колекції: {total_points}"
+# 📋 Одна сторінка колекції: лічильники з user_rarity_counts + картки сторінки
+def render_collection_page(user_id: int, nickname: str, catalog, stats: dict, page: dict) -> tuple:
+    total_by_rarity = catalog.rarity_counts
+
+    reply = f"📋 Колекція гравця **{nickname}**\n━━━━━━━━━━━━━━━━\n"
+
+    for key, label, _, points_per_card in rarity.RARITIES:
+        owned_count = stats["by_rarity"].get(key, 0)
+        total = total_by_rarity.get(key, 0)
+        points = owned_count * points_per_card
+        reply += f"**{label}**: {owned_count}/{total} карток, {points} оч.\n"
+
+    reply += "━━━━━━━━━━━━━━━━\n"
+    current = None
+    for card in page["cards"]:
+        if card["rarity"] != current:
+            current = card["rarity"]
+            reply += f"\n**{rarity.label(current)}**\n"
+        reply += f"• {card['name']}\n"
+
+    reply += f"\n━━━━━━━━━━━━━━━━\n"
+    reply += f"🔢 Всього: {stats['card_count']}/{catalog.total} карток\n"
+    reply += f"🏅 Очки колекції: {stats['points']}"
+
+    nav = []
+    if page["has_prev"] and page["first"]:
+        first_rarity, first_id = page["first"]
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"collection:{user_id}:p:{first_rarity}:{first_id}"))
+    if page["has_next"] and page["last"]:
+        last_rarity, last_id = page["last"]
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"collection:{user_id}:n:{last_rarity}:{last_id}"))
 
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     keyboard = InlineKeyboardMarkup(
-    inline_keyboard=[
+    inline_keyboard=([nav] if nav else []) + [
         [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back:profile:{user_id}")]
     ]
 )
+    return reply, keyboard
 
 
-    try:
-        await message.edit_text(reply, parse_mode="Markdown", reply_markup=keyboard)
-    except Exception:
-        await safe_reply(message, reply, parse_mode="Markdown", reply_markup=keyboard)
-
-
-
-async def show_top(message: types.Message, user_id: int, edit: bool = False):
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-    SELECT users.user_id, users.nickname, users.username,
-           COUNT(user_cards.card_id) AS card_count
-    FROM user_cards
-    JOIN users ON users.user_id = user_cards.user_id
-    GROUP BY user_cards.user_id
-""")
-
-    players = c.fetchall()
-    conn.close()
-
-    # Розрахунок очок за кожного гравця
-    def get_points(user_id):
-        conn = get_connection()
-        c = conn.cursor()
-        c.execute("""
-            SELECT cards.rarity
-            FROM user_cards
-            JOIN cards ON user_cards.card_id = cards.id
-            WHERE user_cards.user_id = ?
-        """, (user_id,))
-        rows = c.fetchall()
-        conn.close()
-
-        rarity_points = {
-            "common": 1,
-            "rare": 2,
-            "super_rare": 3,
-            "epic": 5,
-            "mythic": 7,
-            "legendary": 10,
-            "divine": 15
-        }
-
-        return sum(rarity_points.get(r[0], 0) for r in rows)
-
-    # Побудова топу
-    ranked = sorted(
-        [(uid, nick, uname, cards, get_points(uid)) for uid, nick, uname, cards in players],
-        key=lambda x: (x[3], x[4]), reverse=True
-    )
-
-    text = f"🏆 ТОП {min(len(ranked), 10)} ГРАВЦІВ GD Cards\n────────────\n"
+# 🏆 Текст сторінки топу (кешується в leaderboard до зміни рейтингу)
+def render_top_page(page: int, pages: int, entries: list) -> str:
+    text = f"🏆 ТОП ГРАВЦІВ GD Cards ({page}/{pages})\n────────────\n"
     medals = ["🥇", "🥈", "🥉"]
 
-    for i, (uid, nick, uname, cards, points) in enumerate(ranked[:35], start=1):
+    start = (page - 1) * leaderboard.board.page_size + 1
+    for i, (uid, nick, uname, cards, points) in enumerate(entries, start=start):
         medal = medals[i - 1] if i <= 3 else f"{i}."
         mention = f"[{nick}](https://t.me/{uname})" if uname else f"{nick}"
         text += f"{medal} {mention} — {cards} карт, {points} очок\n"
 
     text += "────────────"
+    return text
+
+
+async def show_top(message: types.Message, user_id: int, edit: bool = False, page: int = 1):
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+    board = leaderboard.board
+    pages = board.pages()
+    page = min(max(page, 1), pages)
+    text = board.page_text(page, render_top_page)
+
+    nav = []
+    if page > 1:
+        nav.append(InlineKeyboardButton(text="⬅️", callback_data=f"top:{user_id}:{page - 1}"))
+    if page < pages:
+        nav.append(InlineKeyboardButton(text="➡️", callback_data=f"top:{user_id}:{page + 1}"))
 
     keyboard = InlineKeyboardMarkup(
-    inline_keyboard=[
+    inline_keyboard=([nav] if nav else []) + [
         [InlineKeyboardButton(text="🔙 Назад", callback_data=f"back:profile:{user_id}")]
     ]
 )
@@ -459,12 +632,12 @@ async def cmd_top(message: types.Message):
 
 @dp.callback_query(lambda c: c.data.startswith("top"))
 async def callback_top(callback: types.CallbackQuery):
-    await show_top(callback.message, user_id=callback.from_user.id, edit=True)
+    parts = callback.data.split(":")
+    page = int(parts[2]) if len(parts) == 3 and parts[2].isdigit() else 1
+    await show_top(callback.message, user_id=callback.from_user.id, edit=True, page=page)
     await callback.answer()
 
     
-from aiogram.exceptions import TelegramBadRequest
-
 @dp.callback_query(lambda c: c.data.startswith("back"))
 async def callback_back(callback: types.CallbackQuery):
     parts = callback.data.split(":")
@@ -477,15 +650,16 @@ async def callback_back(callback: types.CallbackQuery):
 
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
     from aiogram.exceptions import TelegramBadRequest
-    from database import get_nickname, get_user_collection_size, get_total_cards_count, get_last_card_time
 
-    get_or_create_user(owner_id, callback.from_user.username or "без ніка")
-    nickname = get_nickname(owner_id)
-    collected = get_user_collection_size(owner_id)
-    total_cards = get_total_cards_count()
-    collection_points = collected
-    rating = "—"
-    notifications = "выкл"
+    await db.get_or_create_user(owner_id, callback.from_user.username or "без ніка")
+    profile = await db.get_user_profile(owner_id)
+    nickname = profile["nickname"]
+    collected = profile["card_count"]
+    total_cards = await db.get_total_cards_count()
+    collection_points = profile["points"]
+    rank = leaderboard.board.rank(owner_id)
+    rating = f"#{rank}" if rank else "—"
+    notifications = "увімк" if profile["notify"] else "вимк (/notify on)"
 
     text = (
         f"👤 **Профіль гравця**\n"
@@ -493,7 +667,7 @@ async def callback_back(callback: types.CallbackQuery):
         f"Рейтинг: {rating}\n"
         f"Карток зібрано: **{collected} / {total_cards}**\n"
         f"Очки колекції: **{collection_points}**\n"
-        f"Уведомлення: {notifications}"
+        f"Сповіщення: {notifications}"
     )
 
     keyboard = InlineKeyboardMarkup(
@@ -526,13 +700,19 @@ async def cmd_collection(message: types.Message):
 @dp.callback_query(lambda c: c.data.startswith("collection"))
 async def callback_collection(callback: types.CallbackQuery):
     parts = callback.data.split(":")
-    if len(parts) != 2:
+    if len(parts) not in (2, 5):
         return
     user_id = int(parts[1])
     if callback.from_user.id != user_id:
         return
 
-    await show_collection(user_id, callback.message)
+    cursor = None
+    backward = False
+    if len(parts) == 5 and parts[4].isdigit():
+        backward = parts[2] == "p"
+        cursor = (parts[3], int(parts[4]))
+
+    await show_collection(user_id, callback.message, cursor, backward)
     await callback.answer()
 
 from aiogram import Router
@@ -548,12 +728,142 @@ async def cmd_start(msg: Message):
 dp.include_router(router)
 
 
+# 📨 Пачка сповіщень іде з низьким пріоритетом: відповіді гравцям не чекають за нею
+async def send_ready_notifications(batch: list):
+    sent = []
+    with outbound.bulk():
+        for user_id, last_card_time in batch:
+            try:
+                await bot.send_message(user_id, "🃏 Нова картка вже чекає! Тисни /card")
+                sent.append((user_id, last_card_time))
+                notifier.sent += 1
+            except TelegramForbiddenError:
+                # Гравець заблокував бота — більше не пишемо
+                notifier.unsubscribe(user_id)
+                await db.set_notify(user_id, False)
+                notifier.failed += 1
+            except Exception as e:
+                logger.warning("⚠️ Сповіщення для %s не надіслано: %s", user_id, e)
+                notifier.failed += 1
+    if sent:
+        await db.mark_notified(sent)
+
+# Купа відбудовується з бази: після перезапуску сповіщення не губляться і не дублюються
+async def start_notifications(shard: int = 0, shards: int = 1) -> asyncio.Task:
+    since = int(time.time()) - COOLDOWN - notifications.MISSED_WINDOW
+    subscribers = await db.get_notify_subscribers()
+    pending = await db.get_pending_notifications(since)
+    notifier.load(
+        (uid for uid in subscribers if uid % shards == shard),
+        ((uid, t) for uid, t in pending if uid % shards == shard),
+    )
+    return asyncio.create_task(notifier.run(send_ready_notifications))
+
+
 # 🚀 Запуск бота
-async def main():
-    init_db()
-    add_promo_code("BOOST_ME", permanent=True)  # вічний промокод
-    print("✅ Бот запущено!")
+async def prepare():
+    await db.init_db()
+    await db.add_promo_code("BOOST_ME", permanent=True)  # вічний промокод
+    leaderboard.board.load(await db.get_leaderboard_rows())
+
+# 🛑 SIGTERM (перезапуск дайно) і Ctrl+C завершують роботу штатно — до db.shutdown()
+def stop_event() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:     # Windows
+            pass
+    return stop
+
+async def health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+# 🌐 Webhook: Telegram отримує 200 одразу, а оновлення обробляється у фоні.
+# Запити без правильного X-Telegram-Bot-Api-Secret-Token відхиляються з 401.
+def build_webhook_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/", health)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def serve(app: web.Application) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    return runner
+
+async def run_webhook(app: web.Application):
+    stop = stop_event()
+    runner = await serve(app)
+    try:
+        if WEBHOOK_URL:
+            await bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        else:
+            logging.warning("WEBHOOK_URL не задано — вебхук у Telegram не реєструється")
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+# 📡 Polling: вебхук, лишений попереднім режимом, інакше дає 409 на getUpdates
+async def run_polling():
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
+# 🔀 BOT_WORKERS > 1: цей процес лише приймає оновлення і роздає їх воркерам
+async def run_sharded():
+    front = sharding.Front(sharding.WORKERS)
+    front.start()
+    supervisor = asyncio.create_task(front.supervise())
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(sharding.build_front_app(front, WEBHOOK_PATH, WEBHOOK_SECRET))
+        else:
+            await bot.delete_webhook()
+            stop = stop_event()
+            poller = asyncio.create_task(sharding.poll_updates(front, bot, dp.resolve_used_update_types()))
+            waiter = asyncio.create_task(stop.wait())
+            done, _ = await asyncio.wait((poller, waiter), return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if poller in done:
+                poller.result()     # цикл getUpdates сам завершується лише помилкою
+            poller.cancel()
+            await asyncio.gather(poller, return_exceptions=True)
+    finally:
+        supervisor.cancel()
+        front.stop()
+        await bot.session.close()
+
+async def main():
+    await prepare()
+    print(f"✅ Бот запущено! Режим: {BOT_MODE}, процесів: {sharding.WORKERS}")
+    if metrics.METRICS_PORT and sharding.WORKERS == 1:
+        await bot_metrics.start_server()
+    if backup.BACKUP_INTERVAL > 0:
+        asyncio.create_task(backup.backup_loop())
+    if sharding.WORKERS == 1:
+        await start_notifications()
+    try:
+        if sharding.WORKERS > 1:
+            db.shutdown()   # фронт не працює з базою — з'єднання тримають лише воркери
+            await run_sharded()
+        elif BOT_MODE == "webhook":
+            await run_webhook(build_webhook_app())
+        else:
+            await run_polling()
+    finally:
+        db.shutdown()
+
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
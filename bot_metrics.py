@@ -0,0 +1,51 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from metrics import HANDLER_ERRORS, HANDLER_SECONDS, METRICS_HOST, METRICS_PORT, render
+from throttling import LIMITS, event_key
+
+# Мітка — лише відомі команди й префікси callback_data: довільний текст після "/"
+# не повинен вичерпувати MAX_LABELS і потрапляти в експорт
+HANDLER_NAMES = frozenset(LIMITS) | {"text"}
+
+
+# ⏱️ Час кожного оновлення за командою або префіксом callback_data
+class HandlerTimingMiddleware(BaseMiddleware):
+    def __init__(self, names=HANDLER_NAMES):
+        self.names = frozenset(names)
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        _, command, _ = event_key(event)
+        if command is None:
+            name = event.event_type
+        else:
+            name = command if command in self.names else "other"
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - start)
+
+
+async def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,47 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+_MISSING = object()
+
+
+# 🧠 Обмежений LRU-кеш з необов'язковим TTL; безпечний для потоків пулу БД
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._items[key] = (value, expires)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._items.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
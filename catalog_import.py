@@ -0,0 +1,170 @@
+"""Пакетний імпорт карток з маніфесту.
+
+Запуск: python catalog_import.py cards.csv [--images DIR] [--chunk 200] [--dry-run]
+
+Маніфест — CSV з заголовком name,rarity,description,image або JSON Lines
+(.jsonl, по об'єкту на рядок) чи JSON-масив (.json) з тими самими полями.
+Картка з уже наявною назвою оновлюється, нова — додається.
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+import database
+import images
+import rarity
+
+CHUNK_SIZE = 200
+IMAGE_THREADS = min(8, os.cpu_count() or 1)
+MAX_REPORTED_ERRORS = 10
+
+
+class ManifestError(ValueError):
+    pass
+
+
+# 📜 Рядки маніфесту читаються потоково: (номер рядка, словник полів).
+# Рядок JSON Lines віддається текстом — його розбирає _validate, тож зіпсований
+# рядок стає помилкою цього рядка, а не обриває імпорт
+def iter_manifest(path: str) -> Iterator[tuple[int, object]]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+    elif ext == ".jsonl":
+        with open(path, encoding="utf-8-sig") as f:
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, line
+    elif ext == ".json":
+        # Звичайний JSON-масив неможливо читати частинами — для великих сезонів краще .jsonl
+        with open(path, encoding="utf-8-sig") as f:
+            for number, item in enumerate(json.load(f), start=1):
+                yield number, item
+    else:
+        raise ManifestError(f"Невідомий формат маніфесту: {ext or path}")
+
+
+def _validate(row) -> dict:
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except json.JSONDecodeError as e:
+            raise ManifestError(f"некоректний JSON: {e.msg}")
+    if not isinstance(row, dict):
+        raise ManifestError(f"очікувався об'єкт з полями, а не {type(row).__name__}")
+
+    name = str(row.get("name") or "").strip()
+    card_rarity = str(row.get("rarity") or "").strip().lower()
+    description = str(row.get("description") or "").strip()
+    image = str(row.get("image") or row.get("image_path") or "").strip()
+
+    if not name:
+        raise ManifestError("порожня назва")
+    if card_rarity not in rarity.BY_KEY:
+        raise ManifestError(f"невідома рідкість «{card_rarity}» (є: {', '.join(rarity.BY_KEY)})")
+    if not image:
+        raise ManifestError("не вказано зображення")
+    return {"name": name, "rarity": card_rarity, "description": description, "image": image}
+
+
+def _prepare(row, images_dir: str, dry_run: bool) -> dict:
+    card = _validate(row)
+    source = card.pop("image")
+    path = source if os.path.isabs(source) else os.path.join(images_dir, source)
+    if dry_run:
+        if not os.path.isfile(path):
+            raise images.ImageError(f"Файл не знайдено: {path}")
+        card["image_path"] = path
+    else:
+        card["image_path"] = images.ingest_image(path)
+    return card
+
+
+# 📦 Рядки перевіряються і стискаються паралельно (Pillow відпускає GIL),
+# валідні картки пишуться пачками по chunk_size, каталог скидається один раз —
+# і тоді, коли імпорт обірвався після вже закомічених пачок
+def import_manifest(path: str, images_dir: Optional[str] = None, chunk_size: int = CHUNK_SIZE,
+                    dry_run: bool = False) -> dict:
+    images_dir = images_dir or images.INCOMING_DIR
+    started = time.perf_counter()
+    result = {"rows": 0, "inserted": 0, "updated": 0, "rarity_changed": 0, "errors": []}
+    chunk = []
+
+    def write(batch: list):
+        if batch and not dry_run:
+            for key, value in database.upsert_cards(batch).items():
+                result[key] += value
+
+    try:
+        with ThreadPoolExecutor(max_workers=IMAGE_THREADS) as pool:
+            window = []
+
+            def drain(limit: int):
+                while len(window) > limit:
+                    number, future = window.pop(0)
+                    try:
+                        chunk.append(future.result())
+                    except (ManifestError, images.ImageError) as e:
+                        result["errors"].append((number, str(e)))
+                    if len(chunk) >= chunk_size:
+                        write(chunk)
+                        chunk.clear()
+
+            for number, row in iter_manifest(path):
+                result["rows"] += 1
+                window.append((number, pool.submit(_prepare, row, images_dir, dry_run)))
+                drain(IMAGE_THREADS * 4)
+            drain(0)
+            write(chunk)
+    finally:
+        if result["inserted"] or result["updated"]:
+            database.invalidate_catalog()
+    result["elapsed"] = time.perf_counter() - started
+    return result
+
+
+def format_result(result: dict) -> str:
+    lines = [
+        f"📦 Рядків: {result['rows']}, додано: {result['inserted']}, оновлено: {result['updated']}, "
+        f"змінено рідкість: {result['rarity_changed']}, помилок: {len(result['errors'])} "
+        f"({result['elapsed']:.1f} с)"
+    ]
+    for number, error in result["errors"][:MAX_REPORTED_ERRORS]:
+        lines.append(f"❌ рядок {number}: {error}")
+    if len(result["errors"]) > MAX_REPORTED_ERRORS:
+        lines.append(f"… і ще {len(result['errors']) - MAX_REPORTED_ERRORS}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest")
+    parser.add_argument("--images", help=f"тека із зображеннями (за замовчуванням {images.INCOMING_DIR})")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="карток на транзакцію")
+    parser.add_argument("--dry-run", action="store_true", help="лише перевірити маніфест і файли")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    try:
+        result = import_manifest(args.manifest, args.images, args.chunk, args.dry_run)
+    except (ManifestError, OSError, json.JSONDecodeError, csv.Error) as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        database.shutdown()
+    print(format_result(result))
+    if not args.dry_run:
+        print("ℹ️ Запущений бот підхопить зміни після /admin reload")
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,394 @@
 import sqlite3
 import os
 import time
+import queue
 import string
+import logging
 import secrets
-from typing import Optional
+import functools
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+
+import rarity
+import metrics
+from cache import LRUCache
+from sampler import FenwickSampler
 
 DB_PATH = os.path.join("db", "cards.db")
 
+logger = logging.getLogger(__name__)
+
+# ⚙️ Пул з'єднань: кілька постійних з'єднань, відкритих один раз
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,       # ~16 МБ сторінкового кешу на з'єднання
+    "mmap_size": 134217728,     # 128 МБ
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
 def _ensure_db_folder():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 
-def get_connection():
+def _open_connection() -> sqlite3.Connection:
     _ensure_db_folder()
-    return sqlite3.connect(DB_PATH, timeout=5)
+    # isolation_level=None — транзакції відкриваємо явно через transaction()
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=5,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=256,
+    )
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+    if _statement_hook is not None:
+        conn.set_trace_callback(_statement_hook)
+    return conn
 
+# 🔎 Необов'язковий виклик на кожен SQL-оператор — для навантажувальних тестів
+_statement_hook = None
+
+def set_statement_hook(hook):
+    global _statement_hook
+    _statement_hook = hook
+    close_pool()    # нові з'єднання відкриються вже з хуком
+
+
+class ConnectionPool:
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return _open_connection()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._created -= 1
+
+
+_pool = ConnectionPool(POOL_SIZE)
+
+@contextmanager
+def connection():
+    conn = _pool.acquire()
+    try:
+        yield conn
+    finally:
+        _pool.release(conn)
+
+@contextmanager
+def transaction():
+    # Відкладені записи мають потрапити в базу раніше за нову транзакцію
+    _sync_pending()
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+def close_pool():
+    _pool.close()
+
+# ⏱️ Час кожної функції бази даних за її назвою (гістограма bot_db_query_seconds)
+def _timed(func):
+    histogram = metrics.DB_SECONDS.labels(func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return wrapper
+
+def shutdown():
+    if _write_behind is not None:
+        _write_behind.stop()
+    close_pool()
+
+
+# ✍️ Відкладений запис (write-behind): дрібні оновлення від багатьох хендлерів
+# збираються в чергу і комітяться однією транзакцією раз на N мс або M операцій
+WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "0") == "1"
+FLUSH_INTERVAL_MS = int(os.getenv("DB_FLUSH_INTERVAL_MS", "50"))
+FLUSH_MAX_OPS = int(os.getenv("DB_FLUSH_MAX_OPS", "500"))
+MAX_PENDING = int(os.getenv("DB_MAX_PENDING", "5000"))
+
+
+class WriteBehindQueue:
+    def __init__(self, interval_ms: int, max_ops: int, max_pending: int):
+        self.interval = interval_ms / 1000
+        self.max_ops = max_ops
+        self.max_pending = max_pending
+        self._ops = []
+        self._users = {}             # user_id -> незакомічені операції, включно з пачкою в роботі
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, user_id: int, op):
+        with self._cond:
+            self._start()
+            # Зворотний тиск: черга повна — чекаємо, поки потік її скине
+            while len(self._ops) >= self.max_pending and not self._stopped:
+                self._cond.notify_all()
+                self._cond.wait()
+            self._ops.append((user_id, op))
+            self._users[user_id] = self._users.get(user_id, 0) + 1
+            if len(self._ops) >= self.max_ops:
+                self._cond.notify_all()
+        if self._stopped:
+            self.flush()
+
+    def has_pending(self, user_id: Optional[int] = None) -> bool:
+        if user_id is None:
+            return bool(self._users)
+        return user_id in self._users
+
+    @_timed
+    def flush(self):
+        with self._flush_lock:
+            with self._cond:
+                ops, self._ops = self._ops, []
+                self._cond.notify_all()
+            if not ops:
+                return
+            try:
+                with connection() as conn:
+                    try:
+                        conn.execute("BEGIN IMMEDIATE")
+                        for _, op in ops:
+                            op(conn)
+                        conn.execute("COMMIT")
+                    except Exception:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        logger.exception("Write-behind batch failed, retrying one by one")
+                        self._apply_one_by_one(conn, ops)
+            finally:
+                # Гравці вважаються «з відкладеними записами» до COMMIT: читання
+                # під час пачки в роботі чекає на _flush_lock, а не бачить старий рядок
+                self._release(ops)
+
+    def _release(self, ops: list):
+        with self._cond:
+            for user_id, _ in ops:
+                left = self._users[user_id] - 1
+                if left:
+                    self._users[user_id] = left
+                else:
+                    del self._users[user_id]
+
+    @staticmethod
+    def _apply_one_by_one(conn: sqlite3.Connection, ops: list):
+        for user_id, op in ops:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                op(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.exception("Write-behind op for user %s dropped", user_id)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _start(self):
+        if self._thread is None and not self._stopped:
+            self._thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._ops) < self.max_ops:
+                    self._cond.wait(self.interval)
+                stopped = self._stopped
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+            if stopped:
+                return
+
+
+_write_behind = WriteBehindQueue(FLUSH_INTERVAL_MS, FLUSH_MAX_OPS, MAX_PENDING) if WRITE_BEHIND else None
+
+def _sync_pending(user_id: Optional[int] = None):
+    # Читання бачить відкладені записи: якщо вони є — скидаємо їх перед запитом
+    if _write_behind is not None and _write_behind.has_pending(user_id):
+        _write_behind.flush()
+
+def flush_pending():
+    if _write_behind is not None:
+        _write_behind.flush()
+
+
+# 🗂️ Каталог карток у пам'яті: завантажується один раз і перечитується
+# лише після add_card / delete_card_by_id / clear_all_cards
+class CatalogSnapshot(NamedTuple):
+    version: int
+    cards: tuple
+    by_id: dict
+    rarity_counts: dict
+    total: int
+    sampler: FenwickSampler
+
+    def rarity_stats(self, rarity: str) -> tuple[int, int, float]:
+        rarity_count = self.rarity_counts.get(rarity, 0)
+        percent = (rarity_count / self.total * 100) if self.total else 0.0
+        return rarity_count, self.total, percent
 
-def init_db():
-    conn = get_connection()
-    c = conn.cursor()
 
-    c.execute("""
+class CardCatalog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._shared = None
+        self._seen_epoch = 0
+
+    @property
+    def version(self) -> int:
+        self._sync_shared()
+        return self._version
+
+    # 🔀 Спільний для процесів лічильник (multiprocessing.Value): invalidate в
+    # одному воркері змушує всі інші перечитати каталог при наступному зверненні
+    def share(self, epoch):
+        with self._lock:
+            self._shared = epoch
+            self._seen_epoch = epoch.value
+
+    def _sync_shared(self):
+        shared = self._shared
+        if shared is None or shared.value == self._seen_epoch:
+            return
+        with self._lock:
+            epoch = shared.value
+            if epoch != self._seen_epoch:
+                self._seen_epoch = epoch
+                self._version += 1
+
+    def get(self) -> CatalogSnapshot:
+        self._sync_shared()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self._version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != self._version:
+                self._snapshot = self._load(self._version)
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            if self._shared is not None:
+                with self._shared.get_lock():
+                    self._shared.value += 1
+                    self._seen_epoch = self._shared.value
+
+    def set_file_id(self, card_id: int, file_id: Optional[str]):
+        # file_id не впливає на вибір карток — оновлюємо на місці, без перечитування
+        snapshot = self._snapshot
+        if snapshot is not None and card_id in snapshot.by_id:
+            snapshot.by_id[card_id]["file_id"] = file_id
+
+    @staticmethod
+    @_timed
+    def _load(version: int) -> CatalogSnapshot:
+        with connection() as conn:
+            rows = conn.execute(
+                "SELECT id, name, rarity, description, image_path, file_id FROM cards ORDER BY id"
+            ).fetchall()
+        cards = tuple(
+            {"id": r[0], "name": r[1], "rarity": r[2], "description": r[3], "image_path": r[4], "file_id": r[5]}
+            for r in rows
+        )
+        rarity_counts = {}
+        for card in cards:
+            rarity_counts[card["rarity"]] = rarity_counts.get(card["rarity"], 0) + 1
+        return CatalogSnapshot(
+            version=version,
+            cards=cards,
+            by_id={card["id"]: card for card in cards},
+            rarity_counts=rarity_counts,
+            total=len(cards),
+            sampler=FenwickSampler(cards, (rarity.weight(card["rarity"]) for card in cards)),
+        )
+
+
+_catalog = CardCatalog()
+
+def get_catalog() -> CatalogSnapshot:
+    return _catalog.get()
+
+def share_catalog_epoch(epoch):
+    _catalog.share(epoch)
+
+
+# 🧱 Міграції схеми: кожен крок виконується рівно один раз у власній транзакції,
+# номер останнього виконаного зберігається в PRAGMA user_version.
+# Нові зміни схеми — лише новим кроком у кінці MIGRATIONS.
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+# Старі бази (до міграцій) могли вже мати частину колонок — додаємо лише відсутні
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str) -> bool:
+    if column in _columns(conn, table):
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return True
+
+def _m1_base_schema(conn: sqlite3.Connection):
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER PRIMARY KEY,
             username TEXT,
@@ -28,8 +397,7 @@ def init_db():
             points INTEGER DEFAULT 0
         )
     """)
-
-    c.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS cards (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -38,201 +406,693 @@ def init_db():
             image_path TEXT NOT NULL
         )
     """)
-
-    c.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS user_cards (
             user_id INTEGER,
             card_id INTEGER,
             PRIMARY KEY (user_id, card_id)
         )
     """)
-     
-    c.execute("DROP TABLE IF EXISTS promo_codes")
-
-    c.execute("""
+    # used_by лишився від старої схеми — активації тепер у promo_redemptions
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS promo_codes (
             code TEXT PRIMARY KEY,
             used_by TEXT DEFAULT '',
-            uses_left INTEGER DEFAULT 1,
             permanent BOOLEAN DEFAULT 0
         )
     """)
 
+def _m2_promo_uses_and_file_id(conn: sqlite3.Connection):
+    _add_column(conn, "promo_codes", "uses_left", "INTEGER DEFAULT 1")
+    # 📎 file_id фото в Telegram, щоб не завантажувати файл щоразу
+    _add_column(conn, "cards", "file_id", "TEXT")
+
+def _m3_promo_redemptions(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS promo_redemptions (
+            code TEXT,
+            user_id INTEGER,
+            redeemed_at INTEGER DEFAULT 0,
+            PRIMARY KEY (code, user_id)
+        ) WITHOUT ROWID
+    """)
+    # 🧳 Перенесення старого used_by ("1,2,3") у promo_redemptions
+    rows = conn.execute("SELECT code, used_by FROM promo_codes WHERE used_by != ''").fetchall()
+    redemptions = [
+        (code, int(user_id))
+        for code, used_by in rows
+        for user_id in used_by.split(",")
+        if user_id.strip().isdigit()
+    ]
+    conn.executemany("INSERT OR IGNORE INTO promo_redemptions (code, user_id) VALUES (?, ?)", redemptions)
+    conn.execute("UPDATE promo_codes SET used_by='' WHERE used_by != ''")
+
+def _m4_user_counters(conn: sqlite3.Connection):
+    # 📊 Лічильники колекції гравця: картки за рідкістю
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_rarity_counts (
+            user_id INTEGER,
+            rarity TEXT,
+            count INTEGER DEFAULT 0,
+            PRIMARY KEY (user_id, rarity)
+        )
+    """)
+    _add_column(conn, "users", "card_count", "INTEGER DEFAULT 0")
+    _reconcile(conn)
+
+def _m5_user_cards_rarity(conn: sqlite3.Connection):
+    # 📑 Рідкість у user_cards — для посторінкової колекції по (rarity, card_id)
+    if _add_column(conn, "user_cards", "rarity", "TEXT"):
+        conn.execute("""
+            UPDATE user_cards
+            SET rarity = (SELECT cards.rarity FROM cards WHERE cards.id = user_cards.card_id)
+        """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_cards_page ON user_cards (user_id, rarity, card_id)")
+
+def _m6_hot_query_indexes(conn: sqlite3.Connection):
+    # Власники картки для delete_card_by_id — без сканування всієї user_cards і без звернення до рядків
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_cards_card ON user_cards (card_id, user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_rarity ON cards (rarity)")
+    conn.execute("ANALYZE")
+
+def _m7_cards_name_index(conn: sqlite3.Connection):
+    # Пакетний імпорт знаходить наявну картку за назвою
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cards_name ON cards (name)")
+
+def _m8_ready_notifications(conn: sqlite3.Connection):
+    # 🔔 Підписка на «картка готова» і last_card_time, для якого сповіщення вже надіслано
+    _add_column(conn, "users", "notify", "INTEGER DEFAULT 0")
+    _add_column(conn, "users", "notified_card_time", "INTEGER DEFAULT 0")
+    # Частковий індекс лише по підписниках: відбудова розкладу — діапазон за last_card_time
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_notify_time ON users (last_card_time) WHERE notify = 1")
+
+MIGRATIONS = (
+    _m1_base_schema,
+    _m2_promo_uses_and_file_id,
+    _m3_promo_redemptions,
+    _m4_user_counters,
+    _m5_user_cards_rarity,
+    _m6_hot_query_indexes,
+    _m7_cards_name_index,
+    _m8_ready_notifications,
+)
+
+def schema_version() -> int:
+    with connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Звичайний старт — одне читання user_version; DDL виконується лише для нових кроків
+@_timed
+def init_db():
+    if schema_version() >= len(MIGRATIONS):
+        return
+    for number, step in enumerate(MIGRATIONS, start=1):
+        with transaction() as conn:
+            # Перевірка під замком запису: інший процес міг уже виконати цей крок
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= number:
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        logger.info("Schema migrated to version %s (%s)", number, step.__name__)
+
+
+# 👤 Кеш сесій: нік, username, last_card_time і реєстрація без звернення до бази.
+# Записи в users оновлюють кеш одразу (write-through).
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "50000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "600"))
 
-    # 🧩 ВСТАВ ОЦЕ СЮДИ ⬇️ одразу після створення таблиць
-    try:
-        c.execute("ALTER TABLE promo_codes ADD COLUMN uses_left INTEGER DEFAULT 1")
-    except sqlite3.OperationalError:
-        pass  # Якщо колонка вже є — нічого страшного
 
-    conn.commit()
-    conn.close()
+class SessionCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = LRUCache(maxsize, ttl)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, user_id: int) -> Optional[dict]:
+        return self._cache.get(user_id)
+
+    def load_token(self) -> int:
+        return self._writes
+
+    def store_loaded(self, user_id: int, session: dict, token: int):
+        # Якщо між читанням і збереженням був запис — прочитане могло застаріти
+        with self._lock:
+            if token is not None and self._writes == token:
+                self._cache.set(user_id, session)
+
+    def update(self, user_id: int, **fields):
+        with self._lock:
+            self._writes += 1
+            session = self._cache.get(user_id)
+            if session is not None:
+                self._cache.set(user_id, {**session, **fields})
+
+    def clear(self):
+        self._cache.clear()
+
+
+_sessions = SessionCache(SESSION_CACHE_SIZE, SESSION_TTL)
+
+def _session_from_row(row) -> dict:
+    if not row:
+        return {"registered": False, "nickname": None, "username": None, "last_card_time": 0}
+    return {"registered": True, "nickname": row[0], "username": row[1], "last_card_time": int(row[2] or 0)}
+
+# Рядок гравця з незакоміченими відкладеними записами застарілий — такий не кешуємо
+def _load_token(user_id: int) -> Optional[int]:
+    token = _sessions.load_token()
+    if _write_behind is not None and _write_behind.has_pending(user_id):
+        return None
+    return token
+
+def _load_session(conn: sqlite3.Connection, user_id: int) -> dict:
+    token = _load_token(user_id)
+    row = conn.execute("SELECT nickname, username, last_card_time FROM users WHERE user_id=?", (user_id,)).fetchone()
+    session = _session_from_row(row)
+    _sessions.store_loaded(user_id, session, token)
+    return session
+
+@_timed
+def get_session(user_id: int) -> dict:
+    session = _sessions.get(user_id)
+    if session is None:
+        _sync_pending(user_id)
+        with connection() as conn:
+            session = _load_session(conn, user_id)
+    return session
 
 
 # 🔁 Користувачі
+def _apply(sql: str, params: tuple, conn: sqlite3.Connection):
+    conn.execute(sql, params)
+
+def _write(user_id: int, sql: str, params: tuple):
+    if _write_behind is not None:
+        _write_behind.submit(user_id, functools.partial(_apply, sql, params))
+        return
+    with connection() as conn:
+        conn.execute(sql, params)
+
+@_timed
 def get_or_create_user(user_id: int, username: Optional[str]):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM users WHERE user_id=?", (user_id,))
-    if not c.fetchone():
-        c.execute("INSERT INTO users (user_id, username) VALUES (?, ?)", (user_id, username))
-        conn.commit()
-    conn.close()
+    session = _sessions.get(user_id)
+    if session is not None and session["registered"]:
+        return
+
+    if _write_behind is None:
+        with connection() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (user_id, username))
+            _load_session(conn, user_id)
+        return
 
+    session = get_session(user_id)
+    if not session["registered"]:
+        _write(user_id, "INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)", (user_id, username))
+        _sessions.update(user_id, registered=True, username=username)
+
+@_timed
 def set_nickname(user_id: int, nickname: str):
-    conn = get_connection()
-    conn.execute("UPDATE users SET nickname=? WHERE user_id=?", (nickname, user_id))
-    conn.commit()
-    conn.close()
+    _write(user_id, "UPDATE users SET nickname=? WHERE user_id=?", (nickname, user_id))
+    _sessions.update(user_id, nickname=nickname)
 
 def get_nickname(user_id: int) -> Optional[str]:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT nickname FROM users WHERE user_id=?", (user_id,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else None
+    return get_session(user_id)["nickname"]
 
 def get_last_card_time(user_id: int) -> int:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT last_card_time FROM users WHERE user_id=?", (user_id,))
-    row = c.fetchone()
-    conn.close()
-    return int(row[0]) if row and row[0] is not None else 0
+    return get_session(user_id)["last_card_time"]
 
+@_timed
 def update_last_card_time(user_id: int, timestamp: Optional[int] = None):
     if timestamp is None:
         timestamp = int(time.time())
-    conn = get_connection()
-    conn.execute("UPDATE users SET last_card_time=? WHERE user_id=?", (timestamp, user_id))
-    conn.commit()
-    conn.close()
+    _write(user_id, "UPDATE users SET last_card_time=? WHERE user_id=?", (timestamp, user_id))
+    _sessions.update(user_id, last_card_time=timestamp)
+
+# 🎲 Видача картки
+DRAW_OK = "ok"
+DRAW_NO_NICKNAME = "no_nickname"
+DRAW_COOLDOWN = "cooldown"
+DRAW_EMPTY = "empty"
+DRAW_COMPLETE = "complete"
+DRAW_NO_CARD = "no_card"
+
+@_timed
+def draw_card(user_id: int, cooldown: int, now: Optional[int] = None) -> dict:
+    if now is None:
+        now = int(time.time())
+
+    # ⏳ Найчастіша відмова — кулдаун — відповідається з кешу сесії, без бази
+    session = _sessions.get(user_id)
+    if session is not None:
+        if not session["nickname"]:
+            return {"status": DRAW_NO_NICKNAME}
+        if now - session["last_card_time"] < cooldown:
+            return {"status": DRAW_COOLDOWN, "remaining": cooldown - (now - session["last_card_time"])}
+
+    catalog = _catalog.get()
+
+    # BEGIN IMMEDIATE: два швидкі /card одного гравця не пройдуть кулдаун разом
+    with transaction() as conn:
+        token = _load_token(user_id)
+        row = conn.execute(
+            "SELECT nickname, username, last_card_time, card_count, points FROM users WHERE user_id=?", (user_id,)
+        ).fetchone()
+        _sessions.store_loaded(user_id, _session_from_row(row[:3] if row else None), token)
+        if not row or not row[0]:
+            return {"status": DRAW_NO_NICKNAME}
+
+        nickname, username, last_time, card_count, points = row
+        last_time = last_time or 0
+        if now - last_time < cooldown:
+            return {"status": DRAW_COOLDOWN, "remaining": cooldown - (now - last_time)}
+
+        if not catalog.cards:
+            return {"status": DRAW_EMPTY}
+
+        owned = {r[0] for r in conn.execute("SELECT card_id FROM user_cards WHERE user_id=?", (user_id,))}
+        if len(owned) >= catalog.total:
+            return {"status": DRAW_COMPLETE}
+
+        card = catalog.sampler.draw(owned)
+        if card is None:
+            return {"status": DRAW_NO_CARD}
+
+        conn.execute(
+            "INSERT INTO user_cards (user_id, card_id, rarity) VALUES (?, ?, ?)", (user_id, card["id"], card["rarity"])
+        )
+        _increment_user_stats(conn, user_id, card["rarity"])
+        conn.execute("UPDATE users SET last_card_time=? WHERE user_id=?", (now, user_id))
+    _sessions.update(user_id, last_card_time=now)
+
+    return {
+        "status": DRAW_OK,
+        "card": card,
+        "nickname": nickname,
+        "username": username,
+        "card_count": (card_count or 0) + 1,
+        "points": (points or 0) + rarity.points(card["rarity"]),
+        "collection_total": catalog.total,
+        "rarity_stats": catalog.rarity_stats(card["rarity"]),
+    }
 
 # 🔁 Картки
 def get_all_cards() -> list:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT id, name, rarity, description, image_path FROM cards")
-    rows = c.fetchall()
-    conn.close()
-    return [{"id": r[0], "name": r[1], "rarity": r[2], "description": r[3], "image_path": r[4]} for r in rows]
-
-def add_card_to_user(user_id: int, card_id: int):
-    conn = get_connection()
-    conn.execute("INSERT OR IGNORE INTO user_cards (user_id, card_id) VALUES (?, ?)", (user_id, card_id))
-    conn.commit()
-    conn.close()
+    return list(_catalog.get().cards)
 
+# У режимі write-behind запис відкладено, тож результат невідомий — повертає None
+@_timed
+def add_card_to_user(user_id: int, card_id: int) -> Optional[bool]:
+    if _write_behind is not None:
+        _write_behind.submit(user_id, functools.partial(_add_card_to_user, user_id, card_id))
+        return None
+    with transaction() as conn:
+        return _add_card_to_user(user_id, card_id, conn)
+
+def _add_card_to_user(user_id: int, card_id: int, conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT rarity FROM cards WHERE id=?", (card_id,)).fetchone()
+    card_rarity = row[0] if row else None
+    added = conn.execute(
+        "INSERT OR IGNORE INTO user_cards (user_id, card_id, rarity) VALUES (?, ?, ?)",
+        (user_id, card_id, card_rarity)
+    ).rowcount > 0
+    if added and card_rarity is not None:
+        _increment_user_stats(conn, user_id, card_rarity)
+    return added
+
+def _increment_user_stats(conn: sqlite3.Connection, user_id: int, card_rarity: str):
+    conn.execute("""
+        INSERT INTO user_rarity_counts (user_id, rarity, count) VALUES (?, ?, 1)
+        ON CONFLICT (user_id, rarity) DO UPDATE SET count = count + 1
+    """, (user_id, card_rarity))
+    conn.execute(
+        "UPDATE users SET card_count = card_count + 1, points = points + ? WHERE user_id=?",
+        (rarity.points(card_rarity), user_id)
+    )
+
+@_timed
 def get_last_user_card(user_id: int) -> Optional[int]:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT card_id FROM user_cards WHERE user_id = ? ORDER BY rowid DESC LIMIT 1", (user_id,))
-    row = c.fetchone()
-    conn.close()
+    _sync_pending(user_id)
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT card_id FROM user_cards WHERE user_id = ? ORDER BY rowid DESC LIMIT 1", (user_id,)
+        ).fetchone()
     return row[0] if row else None
 
+@_timed
+def get_user_card_ids(user_id: int) -> set:
+    _sync_pending(user_id)
+    with connection() as conn:
+        rows = conn.execute("SELECT card_id FROM user_cards WHERE user_id=?", (user_id,)).fetchall()
+    return {r[0] for r in rows}
+
+@_timed
 def get_user_collection_size(user_id: int) -> int:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM user_cards WHERE user_id=?", (user_id,))
-    count = c.fetchone()[0]
-    conn.close()
-    return count
+    _sync_pending(user_id)
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM user_cards WHERE user_id=?", (user_id,)).fetchone()[0]
 
 def get_total_cards_count() -> int:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM cards")
-    count = c.fetchone()[0]
-    conn.close()
-    return count
+    return _catalog.get().total
+
+# 📊 Лічильники колекції
+@_timed
+def get_user_stats(user_id: int) -> dict:
+    _sync_pending(user_id)
+    with connection() as conn:
+        row = conn.execute("SELECT card_count, points FROM users WHERE user_id=?", (user_id,)).fetchone()
+        by_rarity = dict(conn.execute(
+            "SELECT rarity, count FROM user_rarity_counts WHERE user_id=? AND count > 0", (user_id,)
+        ).fetchall())
+    card_count, points = row if row else (0, 0)
+    return {"card_count": card_count or 0, "points": points or 0, "by_rarity": by_rarity}
+
+@_timed
+def get_user_profile(user_id: int) -> Optional[dict]:
+    _sync_pending(user_id)
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT nickname, username, card_count, points, last_card_time, notify FROM users WHERE user_id=?",
+            (user_id,)
+        ).fetchone()
+    if not row:
+        return None
+    return {
+        "nickname": row[0],
+        "username": row[1],
+        "card_count": row[2] or 0,
+        "points": row[3] or 0,
+        "last_card_time": row[4] or 0,
+        "notify": bool(row[5]),
+    }
+
+# 🔔 Сповіщення про готовність картки
+@_timed
+def set_notify(user_id: int, enabled: bool) -> Optional[int]:
+    _sync_pending(user_id)
+    with connection() as conn:
+        conn.execute("UPDATE users SET notify=? WHERE user_id=?", (int(enabled), user_id))
+        row = conn.execute("SELECT last_card_time FROM users WHERE user_id=?", (user_id,)).fetchone()
+    return (row[0] or 0) if row else None
+
+@_timed
+def get_notify_subscribers() -> list:
+    with connection() as conn:
+        return [row[0] for row in conn.execute("SELECT user_id FROM users WHERE notify = 1")]
+
+# Підписники, чия картка стала або стане готовою після since і кому ще не надіслано
+@_timed
+def get_pending_notifications(since: int) -> list:
+    _sync_pending()
+    with connection() as conn:
+        return conn.execute("""
+            SELECT user_id, last_card_time FROM users
+            WHERE notify = 1 AND last_card_time > ? AND notified_card_time != last_card_time
+        """, (since,)).fetchall()
+
+@_timed
+def mark_notified(sent: list):
+    with transaction() as conn:
+        conn.executemany(
+            "UPDATE users SET notified_card_time=? WHERE user_id=?",
+            ((last_card_time, user_id) for user_id, last_card_time in sent)
+        )
+
+@_timed
+def reconcile_user_stats() -> int:
+    with transaction() as conn:
+        return _reconcile(conn)
+
+def _reconcile(conn: sqlite3.Connection) -> int:
+    rows = conn.execute("""
+        SELECT user_cards.user_id, cards.rarity, COUNT(*)
+        FROM user_cards
+        JOIN cards ON user_cards.card_id = cards.id
+        GROUP BY user_cards.user_id, cards.rarity
+    """).fetchall()
+
+    totals = {}
+    for user_id, card_rarity, count in rows:
+        card_count, points = totals.get(user_id, (0, 0))
+        totals[user_id] = (card_count + count, points + count * rarity.points(card_rarity))
+
+    conn.execute("DELETE FROM user_rarity_counts")
+    conn.executemany("INSERT INTO user_rarity_counts (user_id, rarity, count) VALUES (?, ?, ?)", rows)
+    conn.execute("UPDATE users SET card_count = 0, points = 0")
+    conn.executemany(
+        "UPDATE users SET card_count=?, points=? WHERE user_id=?",
+        ((card_count, points, user_id) for user_id, (card_count, points) in totals.items())
+    )
+    return len(totals)
+
+# 📑 Колекція посторінково: ключ (рідкість у порядку реєстру, card_id)
+def _collection_order(catalog: CatalogSnapshot) -> list:
+    order = [r.key for r in rarity.RARITIES]
+    order += sorted(key for key in catalog.rarity_counts if key not in rarity.BY_KEY)
+    return order
+
+@_timed
+def get_collection_page(user_id: int, cursor: Optional[tuple] = None, backward: bool = False,
+                        limit: int = 20) -> dict:
+    catalog = _catalog.get()
+    order = _collection_order(catalog)
+    if cursor is not None and cursor[0] not in order:
+        cursor = None
+
+    if backward and cursor is not None:
+        keys = order[:order.index(cursor[0]) + 1][::-1]
+        sql = ("SELECT card_id FROM user_cards WHERE user_id=? AND rarity=? AND card_id<? "
+               "ORDER BY card_id DESC LIMIT ?")
+        open_bound = 2 ** 63 - 1
+    else:
+        backward = False
+        keys = order[order.index(cursor[0]):] if cursor is not None else order
+        sql = ("SELECT card_id FROM user_cards WHERE user_id=? AND rarity=? AND card_id>? "
+               "ORDER BY card_id LIMIT ?")
+        open_bound = -1
+
+    ids = []
+    _sync_pending(user_id)
+    with connection() as conn:
+        for key in keys:
+            need = limit + 1 - len(ids)
+            if need <= 0:
+                break
+            bound = cursor[1] if cursor is not None and key == cursor[0] else open_bound
+            ids += [(key, r[0]) for r in conn.execute(sql, (user_id, key, bound, need))]
+
+    more = len(ids) > limit
+    ids = ids[:limit]
+    if backward:
+        ids.reverse()
+
+    cards = [catalog.by_id[card_id] for _, card_id in ids if card_id in catalog.by_id]
+    return {
+        "cards": cards,
+        "first": ids[0] if ids else None,
+        "last": ids[-1] if ids else None,
+        "has_prev": more if backward else cursor is not None,
+        "has_next": True if backward else more,
+        "catalog_version": catalog.version,
+    }
+
+def get_cards_count_by_rarity() -> dict:
+    return dict(_catalog.get().rarity_counts)
 
 def get_rarity_stats(rarity: str) -> tuple[int, int, float]:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM cards WHERE rarity=?", (rarity,))
-    rarity_count = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM cards")
-    total_count = c.fetchone()[0]
-    conn.close()
-    percent = (rarity_count / total_count * 100) if total_count else 0.0
-    return rarity_count, total_count, percent
+    return _catalog.get().rarity_stats(rarity)
 
+# 🏆 Рейтинг
+@_timed
+def get_leaderboard_rows() -> list:
+    _sync_pending()
+    with connection() as conn:
+        return conn.execute(
+            "SELECT user_id, nickname, username, card_count, points FROM users WHERE card_count > 0"
+        ).fetchall()
+
+@_timed
 def clear_all_cards():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM user_cards")
-    c.execute("DELETE FROM cards")
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("DELETE FROM user_cards")
+        conn.execute("DELETE FROM cards")
+        conn.execute("DELETE FROM user_rarity_counts")
+        conn.execute("UPDATE users SET card_count = 0, points = 0")
+    _catalog.invalidate()
 
+@_timed
 def delete_card_by_id(card_id: int) -> bool:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM user_cards WHERE card_id=?", (card_id,))
-    c.execute("DELETE FROM cards WHERE id=?", (card_id,))
-    conn.commit()
-    deleted = c.rowcount > 0
-    conn.close()
+    with transaction() as conn:
+        row = conn.execute("SELECT rarity FROM cards WHERE id=?", (card_id,)).fetchone()
+        if row:
+            owners = "SELECT user_id FROM user_cards WHERE card_id=?"
+            conn.execute(
+                f"UPDATE users SET card_count = card_count - 1, points = points - ? WHERE user_id IN ({owners})",
+                (rarity.points(row[0]), card_id)
+            )
+            conn.execute(
+                f"UPDATE user_rarity_counts SET count = count - 1 WHERE rarity=? AND user_id IN ({owners})",
+                (row[0], card_id)
+            )
+        conn.execute("DELETE FROM user_cards WHERE card_id=?", (card_id,))
+        deleted = conn.execute("DELETE FROM cards WHERE id=?", (card_id,)).rowcount > 0
+    if deleted:
+        _catalog.invalidate()
     return deleted
 
+@_timed
 def add_card(name: str, rarity: str, description: str, image_path: str):
-    conn = get_connection()
-    conn.execute("INSERT INTO cards (name, rarity, description, image_path) VALUES (?, ?, ?, ?)", (name, rarity, description, image_path))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute(
+            "INSERT INTO cards (name, rarity, description, image_path) VALUES (?, ?, ?, ?)",
+            (name, rarity, description, image_path)
+        )
+    _catalog.invalidate()
+
+# 📦 Пакетний upsert для імпорту каталогу: одна транзакція на пачку, картка шукається за назвою.
+# Каталог тут не скидається — імпорт робить це один раз наприкінці через invalidate_catalog().
+@_timed
+def upsert_cards(cards: list) -> dict:
+    result = {"inserted": 0, "updated": 0, "rarity_changed": 0}
+    with transaction() as conn:
+        for card in cards:
+            row = conn.execute(
+                "SELECT id, rarity, image_path FROM cards WHERE name=? ORDER BY id LIMIT 1", (card["name"],)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO cards (name, rarity, description, image_path) VALUES (?, ?, ?, ?)",
+                    (card["name"], card["rarity"], card["description"], card["image_path"])
+                )
+                result["inserted"] += 1
+                continue
+
+            card_id, old_rarity, old_image = row
+            conn.execute(
+                "UPDATE cards SET rarity=?, description=?, image_path=? WHERE id=?",
+                (card["rarity"], card["description"], card["image_path"], card_id)
+            )
+            if card["image_path"] != old_image:
+                conn.execute("UPDATE cards SET file_id=NULL WHERE id=?", (card_id,))
+            if card["rarity"] != old_rarity:
+                _change_card_rarity(conn, card_id, old_rarity, card["rarity"])
+                result["rarity_changed"] += 1
+            result["updated"] += 1
+    return result
+
+# Зміна рідкості вже виданої картки: переносимо її в лічильниках і очках усіх власників
+def _change_card_rarity(conn: sqlite3.Connection, card_id: int, old: str, new: str):
+    owners = "SELECT user_id FROM user_cards WHERE card_id=?"
+    conn.execute(
+        f"UPDATE users SET points = points + ? WHERE user_id IN ({owners})",
+        (rarity.points(new) - rarity.points(old), card_id)
+    )
+    conn.execute(
+        f"UPDATE user_rarity_counts SET count = count - 1 WHERE rarity=? AND user_id IN ({owners})",
+        (old, card_id)
+    )
+    conn.execute("""
+        INSERT INTO user_rarity_counts (user_id, rarity, count)
+        SELECT user_id, ?, 1 FROM user_cards WHERE card_id=?
+        ON CONFLICT (user_id, rarity) DO UPDATE SET count = count + 1
+    """, (new, card_id))
+    conn.execute("UPDATE user_cards SET rarity=? WHERE card_id=?", (new, card_id))
+
+def invalidate_catalog():
+    _catalog.invalidate()
+
+@_timed
+def update_card_image(card_id: int, image_path: str) -> bool:
+    with connection() as conn:
+        updated = conn.execute(
+            "UPDATE cards SET image_path=?, file_id=NULL WHERE id=?", (image_path, card_id)
+        ).rowcount > 0
+    if updated:
+        _catalog.invalidate()
+    return updated
+
+@_timed
+def set_card_file_id(card_id: int, file_id: str):
+    with connection() as conn:
+        conn.execute("UPDATE cards SET file_id=? WHERE id=?", (file_id, card_id))
+    _catalog.set_file_id(card_id, file_id)
+
+@_timed
+def clear_card_file_id(card_id: int):
+    with connection() as conn:
+        conn.execute("UPDATE cards SET file_id=NULL WHERE id=?", (card_id,))
+    _catalog.set_file_id(card_id, None)
 
 # 🔁 Промокоди
+@_timed
 def add_promo_code(code: str, permanent: bool = False):
-    conn = get_connection()
-    conn.execute("INSERT OR IGNORE INTO promo_codes (code, permanent) VALUES (?, ?)", (code, int(permanent)))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute("INSERT OR IGNORE INTO promo_codes (code, permanent) VALUES (?, ?)", (code, int(permanent)))
 
 def generate_promo_code(length: int = 8) -> str:
     return ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(length))
 
 def create_one_time_code(uses: int = 1) -> str:
-    code = generate_promo_code()
-    conn = get_connection()
-    conn.execute("INSERT INTO promo_codes (code, uses_left) VALUES (?, ?)", (code, uses))
-    conn.commit()
-    conn.close()
-    return code
+    return create_promo_codes(1, uses)[0]
 
+def _existing_promo_codes(conn: sqlite3.Connection, codes: set, chunk: int = 500) -> set:
+    codes = list(codes)
+    existing = set()
+    for i in range(0, len(codes), chunk):
+        part = codes[i:i + chunk]
+        placeholders = ",".join("?" * len(part))
+        existing.update(
+            r[0] for r in conn.execute(f"SELECT code FROM promo_codes WHERE code IN ({placeholders})", part)
+        )
+    return existing
+
+@_timed
+def create_promo_codes(count: int, uses: int = 1, length: int = 8) -> list:
+    # 🎟️ Пакетна генерація: колізії відсіюються в пам'яті, вставка — один executemany
+    codes = set()
+    with transaction() as conn:
+        while len(codes) < count:
+            batch = set()
+            while len(batch) < count - len(codes):
+                code = generate_promo_code(length)
+                if code not in codes:
+                    batch.add(code)
+            codes |= batch - _existing_promo_codes(conn, batch)
+
+        conn.executemany(
+            "INSERT INTO promo_codes (code, uses_left) VALUES (?, ?)", ((code, uses) for code in codes)
+        )
+    return list(codes)
+
+@_timed
 def use_promo_code(user_id: int, code: str) -> str:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT code, used_by, uses_left, permanent FROM promo_codes WHERE code=?", (code,))
-    row = c.fetchone()
+    # Перевірка, списання активації і скидання кулдауну — одна транзакція
+    with transaction() as conn:
+        row = conn.execute("SELECT permanent FROM promo_codes WHERE code=?", (code,)).fetchone()
+        if not row:
+            return "❌ Промокод не знайдено."
+        permanent = bool(row[0])
 
-    if not row:
-        result = "❌ Промокод не знайдено."
-    else:
-        code, used_by, uses_left, permanent = row
-        used_list = used_by.split(",") if used_by else []
-
-        if str(user_id) in used_list and not permanent:
-            result = "❌ Ви вже використали цей промокод."
-        elif uses_left <= 0:
-            result = "❌ Цей промокод більше недоступний."
-        else:
-            used_list.append(str(user_id))
-            new_used_by = ",".join(used_list)
-            new_uses_left = uses_left - 1
-
-            # ✅ оновлення promo_codes
-            c.execute(
-                "UPDATE promo_codes SET used_by=?, uses_left=? WHERE code=?",
-                (new_used_by, new_uses_left, code)
-            )
+        used = conn.execute(
+            "SELECT 1 FROM promo_redemptions WHERE code=? AND user_id=?", (code, user_id)
+        ).fetchone()
+        if used and not permanent:
+            return "❌ Ви вже використали цей промокод."
 
-            # ✅ окреме оновлення last_card_time — в іншій функції
-            conn.commit()
-            conn.close()
-            update_last_card_time(user_id, timestamp=0)  # ця функція відкриває власне з'єднання
+        # ✅ вічний промокод не витрачає активацій
+        if not permanent:
+            decremented = conn.execute(
+                "UPDATE promo_codes SET uses_left = uses_left - 1 WHERE code=? AND uses_left > 0", (code,)
+            ).rowcount
+            if not decremented:
+                return "❌ Цей промокод більше недоступний."
 
-            result = f"✅ Кулдаун скинуто! Залишилось активацій: {new_uses_left}"
+        conn.execute(
+            "INSERT OR REPLACE INTO promo_redemptions (code, user_id, redeemed_at) VALUES (?, ?, ?)",
+            (code, user_id, int(time.time()))
+        )
+        conn.execute("UPDATE users SET last_card_time=0 WHERE user_id=?", (user_id,))
+        uses_left = conn.execute("SELECT uses_left FROM promo_codes WHERE code=?", (code,)).fetchone()[0]
+    _sessions.update(user_id, last_card_time=0)
 
-    return result
+    left = "∞" if permanent else uses_left
+    return f"✅ Кулдаун скинуто! Залишилось активацій: {left}"
@@ -0,0 +1,118 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from PIL import Image, UnidentifiedImageError
+
+# 🖼️ Куди складаються підготовлені зображення карток і звідки адмін їх бере
+CARDS_DIR = os.getenv("CARDS_DIR", os.path.join("data", "images", "cards"))
+INCOMING_DIR = os.getenv("CARDS_INCOMING_DIR", os.path.join("data", "images", "incoming"))
+
+MAX_SIDE = 1280              # Telegram однаково зменшує фото до 1280 по довшій стороні
+JPEG_QUALITY = 85
+MAX_SOURCE_BYTES = 20 * 1024 * 1024
+CACHE_BYTES = int(os.getenv("IMAGE_CACHE_MB", "32")) * 1024 * 1024
+
+
+class ImageError(ValueError):
+    pass
+
+
+def resolve_source(filename: str) -> str:
+    if os.path.isabs(filename):
+        return filename
+    return os.path.join(INCOMING_DIR, filename)
+
+
+def _encode(source_path: str) -> bytes:
+    if not os.path.isfile(source_path):
+        raise ImageError(f"Файл не знайдено: {source_path}")
+    if os.path.getsize(source_path) > MAX_SOURCE_BYTES:
+        raise ImageError(f"Файл завеликий: {source_path}")
+
+    try:
+        with Image.open(source_path) as img:
+            # JPEG одразу декодується в зменшеному масштабі — у рази швидше для великих фото
+            img.draft("RGB", (MAX_SIDE, MAX_SIDE))
+            img.load()
+            if img.mode in ("RGBA", "LA", "P"):
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((MAX_SIDE, MAX_SIDE))
+
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+            return buffer.getvalue()
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageError(f"Не вдалося прочитати зображення: {e}") from e
+
+
+# 📥 Перевірка, стиснення і збереження під іменем з хешу вмісту —
+# однакові картинки зберігаються один раз
+def ingest_image(source_path: str) -> str:
+    data = _encode(source_path)
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    os.makedirs(CARDS_DIR, exist_ok=True)
+    path = os.path.join(CARDS_DIR, f"{digest}.jpg")
+
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    cache.put(path, data)
+    return path
+
+
+# 🔥 LRU найгарячіших зображень у пам'яті, обмежений сумарним розміром
+class ImageCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> bytes:
+        with self._lock:
+            data = self._items.get(path)
+            if data is not None:
+                self._items.move_to_end(path)
+                return data
+
+        with open(path, "rb") as f:
+            data = f.read()
+        self.put(path, data)
+        return data
+
+    def put(self, path: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old is not None:
+                self.size -= len(old)
+            self._items[path] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, path: str):
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old is not None:
+                self.size -= len(old)
+
+
+cache = ImageCache(CACHE_BYTES)
+
+
+def load_image(path: str) -> bytes:
+    return cache.get(path)
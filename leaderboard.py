@@ -0,0 +1,98 @@
+from bisect import bisect_left, insort
+from typing import Callable, NamedTuple, Optional
+
+PAGE_SIZE = 10
+
+
+class Entry(NamedTuple):
+    user_id: int
+    nickname: Optional[str]
+    username: Optional[str]
+    card_count: int
+    points: int
+
+
+# 🏆 Рейтинг у пам'яті: відсортований список ключів (-карток, -очок, user_id).
+# Місце гравця шукається бінарним пошуком, а відрендерені сторінки кешуються
+# і скидаються лише ті, на які вплинула зміна.
+class Leaderboard:
+    def __init__(self, page_size: int = PAGE_SIZE):
+        self.page_size = page_size
+        self._keys = []
+        self._entries = {}
+        self._pages = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @staticmethod
+    def _key(entry: Entry) -> tuple:
+        return -entry.card_count, -entry.points, entry.user_id
+
+    def load(self, rows):
+        entries = [Entry(*row) for row in rows]
+        self._entries = {e.user_id: e for e in entries if e.card_count > 0}
+        self._keys = sorted(self._key(e) for e in self._entries.values())
+        self._pages.clear()
+
+    def update(self, user_id: int, nickname: Optional[str], username: Optional[str], card_count: int, points: int):
+        old = self._entries.pop(user_id, None)
+        old_index = None
+        if old is not None:
+            old_index = bisect_left(self._keys, self._key(old))
+            del self._keys[old_index]
+
+        if card_count <= 0:
+            if old_index is not None:
+                self._invalidate(old_index, len(self._keys))
+            return
+
+        entry = Entry(user_id, nickname, username, card_count, points)
+        self._entries[user_id] = entry
+        key = self._key(entry)
+        insort(self._keys, key)
+        new_index = bisect_left(self._keys, key)
+
+        if old_index is None:
+            # Новий гравець зсуває всіх нижче себе
+            self._invalidate(new_index, len(self._keys))
+        else:
+            self._invalidate(min(old_index, new_index), max(old_index, new_index))
+
+    def rename(self, user_id: int, nickname: Optional[str], username: Optional[str] = None):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        self.update(user_id, nickname, username or entry.username, entry.card_count, entry.points)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return bisect_left(self._keys, self._key(entry)) + 1
+
+    def pages(self) -> int:
+        return max(1, -(-len(self._keys) // self.page_size))
+
+    def page(self, number: int) -> list:
+        start = (number - 1) * self.page_size
+        return [self._entries[key[2]] for key in self._keys[start:start + self.page_size]]
+
+    def page_text(self, number: int, render: Callable[[int, int, list], str]) -> str:
+        pages = self.pages()
+        cached = self._pages.get(number)
+        if cached is not None and cached[0] == pages:
+            return cached[1]
+        text = render(number, pages, self.page(number))
+        self._pages[number] = (pages, text)
+        return text
+
+    def _invalidate(self, first_index: int, last_index: int):
+        first_page = first_index // self.page_size + 1
+        last_page = last_index // self.page_size + 1
+        for number in list(self._pages):
+            if first_page <= number <= last_page:
+                del self._pages[number]
+
+
+board = Leaderboard()
@@ -0,0 +1,238 @@
+"""Навантажувальний тест: наповнює базу в реалістичному масштабі і проганяє
+згенеровані оновлення через dp.feed_update з підставною сесією бота.
+
+Запуск: python loadtest.py [--users 100000] [--cards 1000] [--owned 30]
+                           [--updates 2000] [--concurrency 64] [--db path/to/load.db]
+
+--db з уже наповненою базою пропускає наповнення.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+os.environ.setdefault("BOT_TOKEN", "123456:LOADTEST")
+os.environ.setdefault("METRICS_PORT", "0")
+
+import database
+import rarity
+
+SCENARIOS = ("card", "profile", "collection", "top", "promo", "cb:collection", "cb:collection_next",
+             "cb:top", "cb:back")
+PROMO_CODE = "LOADTEST"
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+# 🌱 Наповнення: картки з file_id (як у робочій базі після першої відправки),
+# гравці з ніками і в середньому owned карток на кожного
+def seed(users: int, cards: int, owned: int):
+    keys = [r.key for r in rarity.RARITIES]
+    weights = [r.weight for r in rarity.RARITIES]
+    card_rarities = random.choices(keys, weights, k=cards)
+    start = time.perf_counter()
+
+    with database.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO cards (name, rarity, description, image_path, file_id) VALUES (?, ?, ?, ?, ?)",
+            ((f"Картка {i}", card_rarities[i], "Опис для навантажувального тесту", "missing.jpg", f"FILE{i}")
+             for i in range(cards))
+        )
+        card_ids = [row[0] for row in conn.execute("SELECT id FROM cards ORDER BY id")]
+        by_id = dict(conn.execute("SELECT id, rarity FROM cards"))
+
+        conn.executemany(
+            "INSERT INTO users (user_id, username, nickname, last_card_time) VALUES (?, ?, ?, 0)",
+            ((uid, f"user{uid}", f"Гравець{uid}") for uid in range(1, users + 1))
+        )
+
+        def owned_rows():
+            for uid in range(1, users + 1):
+                for card_id in random.sample(card_ids, min(len(card_ids), random.randint(0, owned * 2))):
+                    yield uid, card_id, by_id[card_id]
+
+        conn.executemany("INSERT INTO user_cards (user_id, card_id, rarity) VALUES (?, ?, ?)", owned_rows())
+        rows = conn.execute("SELECT COUNT(*) FROM user_cards").fetchone()[0]
+
+    database.reconcile_user_stats()
+    database.add_promo_code(PROMO_CODE, permanent=True)
+    print(f"🌱 Наповнено: {users} гравців, {cards} карток, {rows} user_cards за {time.perf_counter() - start:.1f} с")
+
+
+def _is_seeded() -> bool:
+    with database.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] > 0
+
+
+def _user(uid: int) -> dict:
+    return {"id": uid, "is_bot": False, "first_name": "Load", "username": f"user{uid}"}
+
+
+def make_update(update_id: int, scenario: str, uid: int, bot_id: int):
+    from aiogram.types import Update
+
+    now = int(time.time())
+    chat = {"id": uid, "type": "private"}
+    if not scenario.startswith("cb:"):
+        text = f"/promo {PROMO_CODE}" if scenario == "promo" else f"/{scenario}"
+        return Update.model_validate({
+            "update_id": update_id,
+            "message": {"message_id": update_id, "date": now, "chat": chat, "from": _user(uid), "text": text},
+        })
+
+    data = {
+        "cb:collection": f"collection:{uid}",
+        "cb:collection_next": f"collection:{uid}:n:rare:0",
+        "cb:top": f"top:{uid}:{random.randint(1, 5)}",
+        "cb:back": f"back:profile:{uid}",
+    }[scenario]
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(uid),
+            "chat_instance": str(uid),
+            "data": data,
+            "message": {
+                "message_id": update_id, "date": now, "chat": chat, "text": "…",
+                "from": {"id": bot_id, "is_bot": True, "first_name": "Bot"},
+            },
+        },
+    })
+
+
+def _recording_session():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Message
+
+    # 🎭 Підставна сесія: нічого не відправляє, лише рахує виклики і повертає правдоподібні відповіді
+    class RecordingSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.calls = Counter()
+
+        async def make_request(self, bot, method, timeout=None):
+            name = method.__api_method__
+            self.calls[name] += 1
+            if not name.startswith("send"):
+                return True
+            result = {
+                "message_id": sum(self.calls.values()),
+                "date": int(time.time()),
+                "chat": {"id": getattr(method, "chat_id", 0) or 0, "type": "private"},
+            }
+            if name == "sendPhoto":
+                result["photo"] = [{"file_id": str(method.photo), "file_unique_id": "u", "width": 1, "height": 1}]
+            else:
+                result["text"] = getattr(method, "text", "") or ""
+            return Message.model_validate(result, context={"bot": bot})
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return RecordingSession()
+
+
+async def run_phase(app, bot, name: str, scenarios: tuple, updates: int, users: int, concurrency: int,
+                    statements: list) -> dict:
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    session = bot.session
+    calls_before = sum(session.calls.values())
+    statements_before = statements[0]
+    start_id = random.randrange(1, 10 ** 9)
+
+    async def feed(i: int):
+        scenario = scenarios[i % len(scenarios)]
+        update = make_update(start_id + i, scenario, random.randint(1, users), bot.id)
+        async with limit:
+            t = time.perf_counter()
+            await app.dp.feed_update(bot, update)
+            latencies.append(time.perf_counter() - t)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(feed(i) for i in range(updates)))
+    elapsed = time.perf_counter() - start
+    database.flush_pending()
+
+    return {
+        "name": name,
+        "updates": updates,
+        "throughput": updates / elapsed,
+        "p50_ms": _percentile(latencies, 0.5) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "queries": (statements[0] - statements_before) / updates,
+        "calls": (sum(session.calls.values()) - calls_before) / updates,
+    }
+
+
+async def run(args):
+    import bot as app
+    from aiogram import Bot
+
+    # Міряємо обробку, а не захист від флуду
+    app.throttler.limits = {}
+    app.throttler.default_limit = app.throttler.user_limit = (1e9, 1e9)
+    app.throttler.coalesce_window = 0
+    await app.prepare()
+
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=_recording_session())
+    statements = [0]
+    lock = threading.Lock()
+
+    def count_statement(_sql):
+        with lock:
+            statements[0] += 1
+
+    await app.db.run(database.set_statement_hook, count_statement)
+
+    results = []
+    for scenario in SCENARIOS:
+        results.append(await run_phase(app, bot, scenario, (scenario,), args.updates, args.users,
+                                       args.concurrency, statements))
+    results.append(await run_phase(app, bot, "mixed", SCENARIOS, args.updates * 2, args.users,
+                                   args.concurrency, statements))
+
+    print(f"\n{'сценарій':<22}{'оновл.':>8}{'оновл./с':>11}{'p50 мс':>9}{'p99 мс':>9}{'SQL/оновл.':>12}{'API/оновл.':>12}")
+    for row in results:
+        print(f"{row['name']:<22}{row['updates']:>8}{row['throughput']:>11.0f}{row['p50_ms']:>9.2f}"
+              f"{row['p99_ms']:>9.2f}{row['queries']:>12.1f}{row['calls']:>12.2f}")
+
+    await app.db.run(database.set_statement_hook, None)
+    app.db.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--cards", type=int, default=1000)
+    parser.add_argument("--owned", type=int, default=30, help="у середньому карток на гравця")
+    parser.add_argument("--updates", type=int, default=2000, help="оновлень на сценарій")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--db", help="файл бази; якщо вже наповнений — наповнення пропускається")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        database.DB_PATH = os.path.abspath(args.db) if args.db else os.path.join(folder, "load.db")
+        database.init_db()
+        if not _is_seeded():
+            seed(args.users, args.cards, args.owned)
+        database.close_pool()
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import threading
+from bisect import bisect_left
+from typing import Any, Callable
+
+# 📈 Метрики з фіксованими кошиками: запис — це bisect і кілька додавань,
+# без зберігання окремих вимірів. Експорт у текстовому форматі Prometheus.
+# Ядро без залежностей від aiogram/aiohttp — його імпортує шар даних;
+# таймінг хендлерів і HTTP-ендпойнт живуть у bot_metrics.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))    # 0 — не піднімати HTTP-ендпойнт
+MAX_LABELS = 100                                          # решта міток зливається в "other"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    # Оцінка квантиля — верхня межа кошика, у який він потрапляє
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Family:
+    def __init__(self, name: str, help_text: str, label: str, factory: Callable[[], Any]):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str):
+        child = self._children.get(value)
+        if child is None:
+            with self._lock:
+                if value not in self._children and len(self._children) >= MAX_LABELS:
+                    value = "other"
+                child = self._children.get(value)
+                if child is None:
+                    child = self._children[value] = self._factory()
+        return child
+
+    def items(self) -> list:
+        return sorted(self._children.items())
+
+
+_families = []
+_gauges = {}
+
+def histogram(name: str, help_text: str, label: str, buckets: tuple = LATENCY_BUCKETS) -> Family:
+    family = Family(name, help_text, label, lambda: Histogram(buckets))
+    _families.append(("histogram", family))
+    return family
+
+def counter(name: str, help_text: str, label: str) -> Family:
+    family = Family(name, help_text, label, Counter)
+    _families.append(("counter", family))
+    return family
+
+# Значення, які вже рахують інші модулі (черги, лічильники), читаються в момент експорту.
+# Повторна реєстрація з тим самим ім'ям замінює попередню — одна метрика на ім'я.
+def gauge(name: str, help_text: str, read: Callable[[], float], kind: str = "gauge"):
+    _gauges[name] = (help_text, read, kind)
+
+
+HANDLER_SECONDS = histogram("bot_handler_seconds", "Час обробки оновлення", "handler")
+HANDLER_ERRORS = counter("bot_handler_errors_total", "Оновлення, що завершились винятком", "handler")
+DB_SECONDS = histogram("bot_db_query_seconds", "Час виконання функції бази даних", "query", DB_BUCKETS)
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render() -> str:
+    lines = []
+    for kind, family in _families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {kind}")
+        for value, child in family.items():
+            label = f'{family.label}="{_escape(value)}"'
+            if kind == "counter":
+                lines.append(f"{family.name}{{{label}}} {child.value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                lines.append(f'{family.name}_bucket{{{label},le="{_format(bound)}"}} {cumulative}')
+            lines.append(f"{family.name}_sum{{{label}}} {_format(child.sum)}")
+            lines.append(f"{family.name}_count{{{label}}} {child.count}")
+    for name, (help_text, read, kind) in _gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name} {_format(read())}")
+    return "\n".join(lines) + "\n"
+
+
+# 📋 Коротке зведення для /admin stats: найчастіші мітки з середнім і квантилями
+def summary(family: Family, limit: int = 8) -> list:
+    rows = []
+    for value, child in family.items():
+        if child.count:
+            rows.append({
+                "name": value,
+                "count": child.count,
+                "avg_ms": child.sum / child.count * 1000,
+                "p50_ms": child.quantile(0.5) * 1000,
+                "p99_ms": child.quantile(0.99) * 1000,
+                "total_s": child.sum,
+            })
+    rows.sort(key=lambda row: row["total_s"], reverse=True)
+    return rows[:limit]
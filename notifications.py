@@ -0,0 +1,100 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 🔔 Сповіщення «картка готова»: купа (час готовності, user_id, last_card_time).
+# Застарілі записи не видаляються з купи — їх відкидає перевірка при виймані.
+BATCH_SIZE = int(os.getenv("NOTIFY_BATCH", "25"))
+BATCH_PAUSE = float(os.getenv("NOTIFY_BATCH_PAUSE", "1.0"))     # с між пачками
+MISSED_WINDOW = 6 * 3600     # після простою бота сповіщаємо лише тих, чия картка стала готова нещодавно
+
+
+class ReadyNotifier:
+    def __init__(self, cooldown: int):
+        self.cooldown = cooldown
+        self._heap = []
+        self._due = {}               # user_id -> last_card_time, для якого чекаємо сповіщення
+        self._subscribers = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.sent = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def is_subscribed(self, user_id: int) -> bool:
+        return user_id in self._subscribers
+
+    # Відбудова при старті: підписники і (user_id, last_card_time) тих, хто ще не отримав сповіщення
+    def load(self, subscribers, pending):
+        self._subscribers = set(subscribers)
+        self._due = {user_id: last_card_time for user_id, last_card_time in pending}
+        self._heap = [(t + self.cooldown, user_id, t) for user_id, t in self._due.items()]
+        heapq.heapify(self._heap)
+        self._wake()
+
+    def subscribe(self, user_id: int, last_card_time: int = 0):
+        self._subscribers.add(user_id)
+        if last_card_time and last_card_time + self.cooldown > time.time():
+            self.schedule(user_id, last_card_time)
+
+    def unsubscribe(self, user_id: int):
+        self._subscribers.discard(user_id)
+        self._due.pop(user_id, None)
+
+    def schedule(self, user_id: int, last_card_time: int):
+        if user_id not in self._subscribers:
+            return
+        self._due[user_id] = last_card_time
+        entry = (last_card_time + self.cooldown, user_id, last_card_time)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wake()
+
+    def pop_due(self, now: float, limit: int) -> list:
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < limit:
+            _, user_id, last_card_time = heapq.heappop(self._heap)
+            if self._due.get(user_id) == last_card_time:
+                del self._due[user_id]
+                batch.append((user_id, last_card_time))
+        return batch
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # Спить до найближчого часу готовності; нове раніше заплановане сповіщення будить цикл
+    async def run(self, send: Callable[[list], Awaitable[None]], batch_size: int = BATCH_SIZE,
+                  pause: float = BATCH_PAUSE):
+        self._wakeup = asyncio.Event()
+        while True:
+            batch = self.pop_due(time.time(), batch_size)
+            if batch:
+                try:
+                    await send(batch)
+                except Exception:
+                    logger.exception("Ready notifications batch failed")
+                await asyncio.sleep(pause)
+                continue
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "scheduled": len(self._due),
+            "heap": len(self._heap),
+            "sent": self.sent,
+            "failed": self.failed,
+        }
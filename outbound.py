@@ -0,0 +1,192 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+import contextvars
+from contextlib import contextmanager
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from throttling import TokenBucketStore
+
+logger = logging.getLogger(__name__)
+
+# 📤 Ліміти Telegram: ~30 повідомлень/с на бота і ~1/с в один чат (з невеликим запасом).
+# У багатопроцесному режимі глобальний ліміт ділиться між воркерами.
+_WORKERS = max(1, int(os.getenv("BOT_WORKERS", "1")))
+GLOBAL_RATE = float(os.getenv("OUT_GLOBAL_RATE", "25")) / _WORKERS
+GLOBAL_BURST = max(1.0, GLOBAL_RATE)
+CHAT_LIMIT = (3, 1.0)            # (місткість, повідомлень за секунду) на чат
+MAX_RETRIES = int(os.getenv("OUT_MAX_RETRIES", "3"))
+MAX_DELAY = float(os.getenv("OUT_MAX_DELAY", "30"))     # довше чекати немає сенсу — відповідь уже неактуальна
+BACKOFF = 0.5
+
+INTERACTIVE = 0
+BULK = 1
+
+_priority = contextvars.ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+# 📦 Масові розсилки: усе, що надіслано в цьому блоці, пропускає вперед відповіді гравцям
+@contextmanager
+def bulk():
+    token = _priority.set(BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class SendDropped(Exception):
+    pass
+
+
+# 🚪 Глобальне відро з чергою за пріоритетом: токени видаються спершу
+# інтерактивним відповідям, потім масовим розсилкам, у межах пріоритету — по черзі
+class PriorityGate:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._stamp = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump = None
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    def block(self, seconds: float):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def _take(self) -> float:
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self, priority: int):
+        if not self._waiters and self._take() == 0.0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self):
+        while self._waiters:
+            if self._waiters[0][2].done():      # відправника скасували, поки він чекав
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._take()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)[2].set_result(None)
+
+
+# 📮 Усі запити бота проходять тут: відро на чат, глобальне відро з пріоритетами,
+# повтор після RetryAfter і тимчасових помилок. Службові виклики (getUpdates тощо) — напряму.
+class OutboundSender(BaseRequestMiddleware):
+    def __init__(self, global_rate: float = GLOBAL_RATE, global_burst: float = GLOBAL_BURST,
+                 chat_limit: tuple = CHAT_LIMIT, max_retries: int = MAX_RETRIES, max_delay: float = MAX_DELAY):
+        self.gate = PriorityGate(global_rate, global_burst)
+        self.chat_limit = chat_limit
+        self.max_retries = max_retries
+        self.max_delay = max_delay
+        self._chats = TokenBucketStore()
+        self._chat_blocked = {}
+        self.sent = 0
+        self.delayed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    @staticmethod
+    def _is_send(method) -> bool:
+        name = getattr(method, "__api_method__", "")
+        return name.startswith(("send", "edit", "copy", "forward"))
+
+    async def __call__(self, make_request, bot, method):
+        if self._is_send(method):
+            return await self._send(make_request, bot, method)
+        if getattr(method, "__api_method__", "") == "answerCallbackQuery":
+            return await self._with_retries(make_request, bot, method, None, None)
+        return await make_request(bot, method)
+
+    async def _send(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        priority = _priority.get()
+        started = time.monotonic()
+
+        if chat_id is not None:
+            now = time.monotonic()
+            capacity, rate = self.chat_limit
+            wait = self._chats.reserve(chat_id, capacity, rate, now)
+            blocked_until = self._chat_blocked.get(chat_id)
+            if blocked_until is not None:
+                if blocked_until <= now:
+                    del self._chat_blocked[chat_id]
+                else:
+                    wait = max(wait, blocked_until - now)
+            if wait > self.max_delay:
+                # Відкинуте повідомлення не поглиблює борг чату — інакше чат,
+                # у який пишуть безперервно, так і лишився б за лімітом
+                self._chats.refund(chat_id, capacity)
+                self.dropped += 1
+                raise SendDropped(f"chat {chat_id}: черга на {wait:.0f} с")
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        await self.gate.acquire(priority)
+        if time.monotonic() - started > 0.001:
+            self.delayed += 1
+        return await self._with_retries(make_request, bot, method, chat_id, priority)
+
+    async def _with_retries(self, make_request, bot, method, chat_id, priority):
+        attempt = 0
+        while True:
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                delay = float(e.retry_after)
+                if chat_id is not None:
+                    self._chat_blocked[chat_id] = time.monotonic() + delay
+                elif priority is not None:
+                    self.gate.block(delay)
+                # answerCallbackQuery (без чату і пріоритету) чекає лише сам — решту розсилки не зупиняє
+                error = e
+            except (TelegramNetworkError, TelegramServerError) as e:
+                delay = BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5)
+                error = e
+
+            attempt += 1
+            if attempt > self.max_retries or delay > self.max_delay:
+                self.dropped += 1
+                logger.warning("Dropping %s after %s attempts: %s", method.__api_method__, attempt, error)
+                raise error
+            self.retried += 1
+            await asyncio.sleep(delay)
+            if priority is not None:
+                await self.gate.acquire(priority)
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "delayed": self.delayed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "queued": len(self.gate),
+        }
@@ -0,0 +1,40 @@
+from typing import NamedTuple
+
+
+class Rarity(NamedTuple):
+    key: str
+    label: str
+    weight: float
+    points: int
+
+
+# 💎 Єдиний реєстр рідкостей — від найрідкіснішої до найпоширенішої.
+# Звідси беруться ваги випадіння, підписи та очки колекції.
+RARITIES = (
+    Rarity("divine", "Божественна ✴️", 0.2, 15),
+    Rarity("legendary", "Легендарна 🟡", 1, 10),
+    Rarity("mythic", "Міфічна 🔴", 3, 7),
+    Rarity("epic", "Епічна 🟣", 5, 5),
+    Rarity("super_rare", "Суперрідкісна 🔵", 10, 3),
+    Rarity("rare", "Рідкісна 🟢", 25, 2),
+    Rarity("common", "Звичайна ⚪️", 60, 1),
+)
+
+BY_KEY = {r.key: r for r in RARITIES}
+
+DEFAULT_WEIGHT = 1
+
+
+def weight(key: str) -> float:
+    r = BY_KEY.get(key)
+    return r.weight if r else DEFAULT_WEIGHT
+
+
+def points(key: str) -> int:
+    r = BY_KEY.get(key)
+    return r.points if r else 0
+
+
+def label(key: str) -> str:
+    r = BY_KEY.get(key)
+    return r.label if r else key.capitalize()
@@ -0,0 +1,72 @@
+import random
+from bisect import bisect_right
+from typing import Iterable, Optional
+
+
+# 🎲 Зважений вибір картки через дерево Фенвіка (префіксні суми ваг).
+# Виключені картки (вже зібрані гравцем) віднімаються під час спуску по дереву,
+# тож вибір коштує O(log n · log k) без перебудови структури.
+class FenwickSampler:
+    def __init__(self, cards: Iterable[dict], weights: Iterable[float]):
+        self.cards = list(cards)
+        self.weights = [float(w) for w in weights]
+        if len(self.cards) != len(self.weights):
+            raise ValueError("cards і weights мають бути однакової довжини")
+
+        self._pos = {card["id"]: i + 1 for i, card in enumerate(self.cards)}
+        n = len(self.cards)
+        self._tree = [0.0] * (n + 1)
+        for i, w in enumerate(self.weights, start=1):
+            self._tree[i] += w
+            parent = i + (i & -i)
+            if parent <= n:
+                self._tree[parent] += self._tree[i]
+        self.total = sum(self.weights)
+
+        self._top_bit = 1
+        while self._top_bit * 2 <= n:
+            self._top_bit *= 2
+
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def draw(self, excluded_ids: Iterable[int] = (), rng: random.Random = random) -> Optional[dict]:
+        n = len(self.cards)
+        positions = sorted(self._pos[cid] for cid in set(excluded_ids) if cid in self._pos)
+
+        # Префіксні ваги виключених карток у порядку позицій
+        excluded_prefix = []
+        acc = 0.0
+        for p in positions:
+            acc += self.weights[p - 1]
+            excluded_prefix.append(acc)
+
+        available = self.total - acc
+        if n == 0 or len(positions) == n or available <= 0:
+            return None
+
+        target = rng.random() * available
+        pos = 0
+        prefix = 0.0
+        step = self._top_bit
+        while step:
+            nxt = pos + step
+            if nxt <= n:
+                k = bisect_right(positions, nxt)
+                excluded = excluded_prefix[k - 1] if k else 0.0
+                if prefix + self._tree[nxt] - excluded <= target:
+                    pos = nxt
+                    prefix += self._tree[nxt]
+            step >>= 1
+
+        # Похибка округлення може вивести за межі або на виключену картку
+        excluded_set = set(positions)
+        index = pos + 1
+        if index > n or index in excluded_set or self.weights[index - 1] <= 0:
+            index = next(
+                (i for i in range(n, 0, -1) if i not in excluded_set and self.weights[i - 1] > 0),
+                None,
+            )
+            if index is None:
+                return None
+        return self.cards[index - 1]
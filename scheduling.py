@@ -0,0 +1,81 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from throttling import event_key
+
+MAX_CONCURRENCY = int(os.getenv("BOT_CONCURRENCY", "64"))
+
+
+# 🧵 Планувальник оновлень: різні гравці обробляються паралельно (не більше
+# MAX_CONCURRENCY одночасно), а оновлення одного гравця — строго по черзі.
+# Замок гравця живе, поки на нього хтось чекає, і видаляється, щойно черга порожня.
+class UserScheduler(BaseMiddleware):
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._locks = {}            # user_id -> [asyncio.Lock, кількість оновлень у черзі]
+        self.running = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.handled = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user_id = event_key(event)[0]
+        if user_id is None:
+            return await handler(event, data)
+
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+
+        queued = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        started = False
+        try:
+            # Спершу черга гравця, потім глобальний слот — той, хто чекає на себе, не займає слот
+            async with entry[0]:
+                async with self._slots:
+                    started = True
+                    self._record_wait(time.monotonic() - queued)
+                    self.running += 1
+                    try:
+                        return await handler(event, data)
+                    finally:
+                        self.running -= 1
+        finally:
+            if not started:
+                self.waiting -= 1
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+    def _record_wait(self, wait: float):
+        self.waiting -= 1
+        self.handled += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "active_users": len(self._locks),
+            "handled": self.handled,
+            "wait_avg_ms": self.wait_total / self.handled * 1000 if self.handled else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
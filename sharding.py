@@ -0,0 +1,230 @@
+import os
+import sys
+import signal
+import asyncio
+import logging
+import secrets
+import threading
+import multiprocessing as mp
+from queue import Empty
+from typing import Optional
+
+import aiohttp
+from aiohttp import web
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# 🔀 Багатопроцесний режим: фронт-процес лише отримує оновлення і роздає їх
+# воркерам за user_id, тож усі оновлення одного гравця обробляє один процес
+WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+LEADERBOARD_RESYNC = float(os.getenv("LEADERBOARD_RESYNC", "30"))   # с між перечитуваннями рейтингу у воркері
+SUPERVISE_INTERVAL = 5.0
+POLL_TIMEOUT = 30
+
+# Ключі оновлень, у яких є автор; решта йде у воркер 0
+_EVENT_KEYS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "my_chat_member", "chat_member", "chat_join_request", "pre_checkout_query", "shipping_query",
+)
+
+
+def update_user_id(update: dict) -> int:
+    for key in _EVENT_KEYS:
+        event = update.get(key)
+        if event:
+            author = event.get("from") or event.get("chat") or {}
+            return int(author.get("id", 0))
+    return 0
+
+
+def shard_of(update: dict, workers: int) -> int:
+    return update_user_id(update) % workers
+
+
+# 👷 Воркер: власний пул з'єднань, кеші та сесія бота; база спільна (WAL + BEGIN IMMEDIATE)
+def worker_main(index: int, updates, epoch):
+    logging.basicConfig(level=logging.INFO)
+    # Зупиняє воркер фронт — None у черзі після вже прийнятих оновлень, тож сигнали
+    # перезапуску (їх отримує вся група процесів) не обривають обробку посередині
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    database.share_catalog_epoch(epoch)
+    asyncio.run(_worker(_bot_module(), index, updates))
+
+# Під spawn дочірній процес уже виконав bot.py як __mp_main__ — повторний import bot
+# створив би другий Bot, Dispatcher і продублював би метрики
+def _bot_module():
+    main = sys.modules.get("__mp_main__")
+    if main is not None and os.path.basename(getattr(main, "__file__", "") or "") == "bot.py":
+        return main
+    import bot
+    return bot
+
+
+async def _worker(app, index: int, updates):
+    # Рейтинг бачить нарахування інших воркерів лише після перечитування
+    async def resync_leaderboard():
+        while True:
+            await asyncio.sleep(LEADERBOARD_RESYNC)
+            try:
+                app.leaderboard.board.load(await app.db.get_leaderboard_rows())
+            except Exception:
+                logger.exception("Worker %s: leaderboard resync failed", index)
+
+    async def handle(update: dict):
+        try:
+            await app.dp.feed_raw_update(app.bot, update)
+        except Exception:
+            logger.exception("Worker %s: update %s failed", index, update.get("update_id"))
+
+    app.leaderboard.board.load(await app.db.get_leaderboard_rows())
+    if app.metrics.METRICS_PORT:
+        # Кожен воркер віддає власні метрики на METRICS_PORT + 1 + номер
+        await app.bot_metrics.start_server(app.metrics.METRICS_PORT + 1 + index)
+    resync = asyncio.create_task(resync_leaderboard())
+    notify = await app.start_notifications(index, WORKERS)   # кожен воркер сповіщає лише своїх гравців
+    loop = asyncio.get_running_loop()
+    inbox = asyncio.Queue()
+    tasks = set()
+
+    # Черга читається daemon-потоком, а не через run_in_executor: якщо цикл подій упаде,
+    # процес завершиться (і фронт його перезапустить), а не чекатиме вічно на updates.get()
+    def read_updates():
+        while True:
+            update = updates.get()
+            try:
+                loop.call_soon_threadsafe(inbox.put_nowait, update)
+            except RuntimeError:    # цикл уже закрито
+                return
+            if update is None:
+                return
+
+    threading.Thread(target=read_updates, name=f"worker-{index}-updates", daemon=True).start()
+    logger.info("Worker %s started (pid %s)", index, os.getpid())
+    try:
+        # Оновлення йдуть задачами — порядок у межах гравця тримає UserScheduler
+        while True:
+            update = await inbox.get()
+            if update is None:
+                break
+            task = asyncio.create_task(handle(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        resync.cancel()
+        notify.cancel()
+        await app.bot.session.close()
+        app.db.shutdown()
+
+
+class Front:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._ctx = mp.get_context("spawn")
+        self.epoch = self._ctx.Value("q", 0)
+        self.queues = [self._ctx.Queue() for _ in range(workers)]
+        self.processes: list[Optional[mp.Process]] = [None] * workers
+        self.routed = [0] * workers
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(index, self.queues[index], self.epoch),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def route(self, update: dict):
+        index = shard_of(update, self.workers)
+        self.routed[index] += 1
+        self.queues[index].put(update)
+
+    async def supervise(self):
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    moved = self._replace_queue(index)
+                    logger.error("Worker %s exited with %s, restarting (%s queued updates moved)",
+                                 index, process.exitcode, moved)
+                    self._spawn(index)
+
+    # Воркер, убитий усередині updates.get(), лишає замок читання черги захопленим —
+    # новий читач на ній блокується назавжди. Тому новий воркер отримує нову чергу.
+    # Зі старої переносимо лише те, що читається без очікування; оновлення, які
+    # воркер уже взяв у роботу або які застрягли за його замком, втрачаються.
+    def _replace_queue(self, index: int) -> int:
+        old, new = self.queues[index], self._ctx.Queue()
+        moved = 0
+        while True:
+            try:
+                new.put(old.get_nowait())
+            except (Empty, OSError, EOFError):
+                break
+            moved += 1
+        old.close()
+        old.cancel_join_thread()
+        self.queues[index] = new
+        return moved
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.kill()      # SIGTERM воркер ігнорує
+
+
+# 📥 Long polling без розбору оновлень у моделі aiogram — лише сирий JSON
+async def poll_updates(front: Front, bot, allowed_updates: list):
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    offset = None
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)) as http:
+        while True:
+            payload = {"timeout": POLL_TIMEOUT, "allowed_updates": allowed_updates}
+            if offset is not None:
+                payload["offset"] = offset
+            try:
+                async with http.post(url, json=payload) as resp:
+                    data = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            if not data.get("ok"):
+                logger.warning("getUpdates error: %s", data.get("description"))
+                await asyncio.sleep(1)
+                continue
+            for update in data["result"]:
+                offset = update["update_id"] + 1
+                front.route(update)
+
+
+# 🌐 Вебхук фронту: перевірка секрету, 200 одразу, далі оновлення йде у воркер
+def build_front_app(front: Front, path: str, secret_token: str) -> web.Application:
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, secret_token):
+            return web.Response(body="Unauthorized", status=401)
+        front.route(await request.json())
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_get("/", health)
+    app.router.add_post(path, handle)
+    return app
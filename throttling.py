@@ -0,0 +1,144 @@
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+
+# 🚦 Ліміти: ключ -> (місткість відра, поповнення токенів за секунду).
+# Ключ — команда без "/" або "cb:" + префікс callback_data.
+LIMITS = {
+    "card": (3, 0.2),
+    "top": (3, 0.2),
+    "collection": (3, 0.5),
+    "profile": (3, 0.5),
+    "promo": (3, 0.1),
+    "genpromo": (2, 0.1),
+    "cb:top": (4, 1.0),
+    "cb:collection": (4, 1.0),
+    "cb:back": (4, 1.0),
+}
+DEFAULT_LIMIT = (5, 1.0)
+USER_LIMIT = (20, 2.0)          # загальне відро гравця на всі команди
+COALESCE_WINDOW = 1.0           # однакові натискання кнопки в цьому вікні відкидаються
+IDLE_TTL = 300.0
+
+
+# 🪣 Відра токенів у словнику [токени, час останнього звернення];
+# відра, що простоюють довше IDLE_TTL, однаково повні — їх просто видаляємо
+class TokenBucketStore:
+    def __init__(self, idle_ttl: float = IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._buckets = {}
+        self._next_sweep = time.monotonic() + idle_ttl
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, key, capacity: float, rate: float, now: float) -> bool:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(capacity), now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+        return False
+
+    # Як allow, але токен береться в борг: повертає, скільки секунд чекати своєї черги
+    def reserve(self, key, capacity: float, rate: float, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(capacity), now]
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+        bucket[0] -= 1
+        return max(0.0, -bucket[0] / rate)
+
+    # Повернути токен, узятий reserve, якщо запит так і не було виконано
+    def refund(self, key, capacity: float):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(capacity, bucket[0] + 1)
+
+    def sweep(self, now: float):
+        deadline = now - self.idle_ttl
+        for key in [k for k, b in self._buckets.items() if b[1] < deadline]:
+            del self._buckets[key]
+        self._next_sweep = now + self.idle_ttl
+
+
+def event_key(update: Update) -> tuple:
+    if update.message and update.message.from_user:
+        text = update.message.text or ""
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0][1:].split("@", 1)[0].lower()
+        else:
+            command = "text"
+        return update.message.from_user.id, command, None
+    if update.callback_query:
+        data = update.callback_query.data or ""
+        return update.callback_query.from_user.id, "cb:" + data.split(":", 1)[0], update.callback_query
+    return None, None, None
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, limits: Optional[dict] = None, default_limit: tuple = DEFAULT_LIMIT,
+                 user_limit: tuple = USER_LIMIT, coalesce_window: float = COALESCE_WINDOW,
+                 exempt_ids: tuple = ()):
+        self.limits = dict(LIMITS if limits is None else limits)
+        self.default_limit = default_limit
+        self.user_limit = user_limit
+        self.coalesce_window = coalesce_window
+        self.exempt_ids = set(exempt_ids)
+        self.buckets = TokenBucketStore()
+        self._recent_callbacks = TokenBucketStore(idle_ttl=max(coalesce_window * 10, 10.0))
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user_id, command, callback = event_key(event)
+        if user_id is None or user_id in self.exempt_ids:
+            return await handler(event, data)
+
+        now = time.monotonic()
+
+        # Повторне натискання тієї самої кнопки — відповідаємо і нічого не робимо
+        if callback is not None and self.coalesce_window > 0:
+            rate = 1.0 / self.coalesce_window
+            if not self._recent_callbacks.allow((user_id, callback.data), 1, rate, now):
+                return await self._drop(callback)
+
+        capacity, rate = self.user_limit
+        allowed = self.buckets.allow(user_id, capacity, rate, now)
+        if allowed:
+            capacity, rate = self.limits.get(command, self.default_limit)
+            allowed = self.buckets.allow((user_id, command), capacity, rate, now)
+
+        if not allowed:
+            return await self._drop(callback)
+        return await handler(event, data)
+
+    async def _drop(self, callback) -> Any:
+        self.dropped += 1
+        if callback is not None:
+            try:
+                await callback.answer("⏳ Зачекай трохи…")
+            except Exception:
+                pass
+        return UNHANDLED